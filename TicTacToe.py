@@ -1,28 +1,319 @@
-from prettytable import PrettyTable
-from copy import deepcopy
-from random import random
+from random import Random, random, seed as seedRandom
+from bisect import bisect_right
+from time import perf_counter, perf_counter_ns
+import importlib.util
+import marshal
 import math
+import os
+import sys
+
+def lazyImport(name):
+    # Returns a module that is only loaded the first time one of its attributes is used, so that importing this file (in
+    # the main process or in each worker process) doesn't pay for numpy unless the batch engine or a table needs it
+    if (name in sys.modules): return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+np = lazyImport("numpy")
+
+#############################################
+# Board Representation
+#############################################
+# Each cell on the board is numbered from 0 so that cell = row * cols + col.  On the standard 3x3 board:
+#
+#  0 | 1 | 2
+# -----------
+#  3 | 4 | 5
+# -----------
+#  6 | 7 | 8
+#
+# The counters belonging to each player are stored as a bit mask where bit n is set if the player has a counter in cell n.
+# This lets us test whole rows, columns and diagonals with a single bitwise operation rather than building lists of cells.
+#
+# The board also carries a key, which is updated as each counter is placed by adding a number for the counter and cell.
+# On the 3x3 board the number for a counter of piece p (O = 1 and X = 2) in cell n is p * 3^n, so the key is the board
+# written in base 3 and every board has its own key.  Larger boards have far too many states for that, so each counter
+# and cell is given a random 64-bit number instead (Zobrist hashing) and the key is taken modulo the size of a table.
+#############################################
+
+class Geometry:
+    # An m x n board where a player needs k counters in a row (across, down or diagonally) to win.  It holds every line of
+    # k cells and the lines through each cell, so a move only needs to be checked against the lines through its cell.
+    # Tables that are indexed by board key (the learned statevalues and the MCTS nodes) have tableSize entries
+    def __init__(self, rows=3, cols=3, k=3, tableBits=20, seed=0):
+        if (k > max(rows, cols)): raise ValueError("k can't be more than the number of rows or columns")
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        self.cells = rows * cols
+        self.full = (1 << self.cells) - 1
+        self.cellBits = [1 << cell for cell in range(self.cells)]
+
+        # Every line of k cells: across, down, diagonally down to the right and then diagonally down to the left
+        def line(row, col, rowStep, colStep):
+            return sum(self.cellBits[(row + i * rowStep) * cols + col + i * colStep] for i in range(k))
+
+        self.lines = ([line(row, col, 0, 1) for row in range(rows) for col in range(cols - k + 1)]
+                      + [line(row, col, 1, 0) for col in range(cols) for row in range(rows - k + 1)]
+                      + [line(row, col, 1, 1) for row in range(rows - k + 1) for col in range(cols - k + 1)]
+                      + [line(row, col, 1, -1) for row in range(rows - k + 1) for col in range(k - 1, cols)])
+        self.lineCells = [[cell for cell in range(self.cells) if (line & self.cellBits[cell])] for line in self.lines]
+        self.cellLines = [[line for line in self.lines if (line & bit)] for bit in self.cellBits]
+
+        # Random numbers for each counter in each cell, from their own generator so the games played don't depend on them
+        rng = Random(seed)
+        self.zobrist = {"O": [rng.getrandbits(64) for cell in range(self.cells)], "X": [rng.getrandbits(64) for cell in range(self.cells)]}
+        self.tableSize = 1 << tableBits
+        self.stateIds = HashedStateIds(self.tableSize)
+        self.numStates = self.tableSize
+        self.staticProbabilities = None
+
+    def prepareStates(self):
+        # Makes sure stateIds and numStates are ready before anything is indexed by them.  Hashed ids need no setting up
+        pass
+
+    def emptyCells(self, occupied):
+        # The empty cells in cell order
+        return [cell for cell in range(self.cells) if (occupied & self.cellBits[cell] == 0)]
+
+    def completesLine(self, counters, cell):
+        # Whether a counter in cell gives these counters a line
+        for line in self.cellLines[cell]:
+            if (counters & line == line): return True
+        return False
+
+    def hasLine(self, counters):
+        # Whether these counters contain a line anywhere on the board
+        for line in self.lines:
+            if (counters & line == line): return True
+        return False
+
+    def winningCell(self, board, Me):
+        # The empty cell that completes the first line Me only needs one more counter for, or -1 if there isn't one
+        mine = board.counters[Me]
+        theirs = board.counters[opponents[Me]]
+        for line in self.lines:
+            if (line & theirs == 0 and bin(line & mine).count("1") == self.k - 1):
+                return (line & ~mine).bit_length() - 1
+        return -1
+
+    def staticCell(self, board):
+        # Picks an empty cell weighted by the number of lines through it
+        if (self.staticProbabilities is None): self.staticProbabilities = generateStaticProbabilities(Board(self))
+        return getProbabilityCell(board, self.staticProbabilities)
+
+    def dynamicCell(self, board, Me):
+        # Picks an empty cell weighted by the number of lines through it that the enemy hasn't blocked
+        return getProbabilityCell(board, generateDynamicProbabilities(board, Me, opponents[Me]))
+
+class TicTacToeGeometry(Geometry):
+    # The standard 3x3 board.  It has few enough states that everything can be looked up in the tables below, which are
+    # indexed by the set of counters or by the board key, so the methods just look up the answer
+    def __init__(self):
+        Geometry.__init__(self, 3, 3, 3)
+        self.zobrist = {"O": [1 * 3**cell for cell in range(9)], "X": [2 * 3**cell for cell in range(9)]}
+        self.tableSize = 3**9
+
+        # Every board reached in a 3x3 game has its own id, given out by numberStates the first time they are needed
+        self.stateIds = None
+        self.numStates = None
+
+    def prepareStates(self):
+        numberStates()
+
+    def emptyCells(self, occupied):
+        return emptyCellLists[occupied]
+
+    def completesLine(self, counters, cell):
+        return victoryTable[counters]
+
+    def hasLine(self, counters):
+        return victoryTable[counters]
+
+    def winningCell(self, board, Me):
+        if (winningCells is None): buildMoveTables()
+        return winningCells[Me][board.key]
+
+    def staticCell(self, board):
+        if (staticCells is None): buildMoveTables()
+        return getTableCell(board, staticCells)
+
+    def dynamicCell(self, board, Me):
+        if (dynamicCells is None): buildMoveTables()
+        return getTableCell(board, dynamicCells[Me])
+
+class HashedStateIds:
+    # Stands in for stateIds on boards with too many states to number them all, mapping each key to an entry in a table of
+    # a fixed size.  Boards can share an entry, but with a large enough table few of the boards reached in games will
+    __slots__ = ("size",)
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, key):
+        return key % self.size
+
+class Board:
+    # Holds the counters for each player as a bit mask, keyed by the player's symbol, along with the key for the board
+    # state and the geometry of the board (3x3 unless another is given)
+    __slots__ = ("counters", "key", "geometry")
+
+    def __init__(self, geometry=None):
+        self.counters = {"O": 0, "X": 0}
+        self.key = 0
+        self.geometry = standardGeometry if (geometry is None) else geometry
+
+pieceValues = {"O": 1, "X": 2}
+opponents = {"O": "X", "X": "O"}
+powersOfThree = [3**cell for cell in range(9)]
+
+cellBits = [1 << cell for cell in range(9)]
+
+standardGeometry = TicTacToeGeometry()
+
+# The 8 winning combinations on the 3x3 board: the three rows, the three columns and then the two diagonals
+winningLines = standardGeometry.lines
+
+# For every possible set of counters we can precompute whether it contains a winning combination...
+victoryTable = [any(mask & line == line for line in winningLines) for mask in range(512)]
+
+# ...how many counters have been placed...
+counterCounts = [bin(mask).count("1") for mask in range(512)]
+
+# ...and which cells are still empty (in cell order)
+emptyCellLists = [[cell for cell in range(9) if (mask & cellBits[cell] == 0)] for mask in range(512)]
+
+def placeCounter(board, cell, Me):
+    # Places a counter in the given cell, keeping the board key up to date
+    geometry = board.geometry
+    board.counters[Me] = board.counters[Me] | geometry.cellBits[cell]
+    board.key = board.key + geometry.zobrist[Me][cell]
+
+def removeCounter(board, cell, Me):
+    # Takes back a counter placed with placeCounter.  Searches place a counter, look at the board and then take it back,
+    # so they can try every move on one board without copying it
+    geometry = board.geometry
+    board.counters[Me] = board.counters[Me] & ~geometry.cellBits[cell]
+    board.key = board.key - geometry.zobrist[Me][cell]
+
+def keyAfterMove(board, cell, Me):
+    # Returns the key the board would have if we placed a counter in the given cell, without changing the board
+    return board.key + board.geometry.zobrist[Me][cell]
+
+def copyBoard(board):
+    # Returns a new board with the same counters
+    board2 = Board(board.geometry)
+    board2.counters["O"] = board.counters["O"]
+    board2.counters["X"] = board.counters["X"]
+    board2.key = board.key
+    return board2
+
+#############################################
+# Symmetry
+#############################################
+# Rotating or reflecting a board doesn't change how good it is, so each of the 8 versions of a board can share one entry
+# in the learned state values.  We pick the version with the lowest key as the canonical board and give each canonical
+# board that can be reached in a game its own dense id, so statevalues only needs one entry per id.
+#
+# symmetries[s][cell] is the cell that moves into cell when the board is transformed
+#############################################
+
+symmetries = [[row * 3 + col for row in range(3) for col in range(3)],                 # Identity
+              [(2 - col) * 3 + row for row in range(3) for col in range(3)],           # Rotate 90 degrees
+              [(2 - row) * 3 + (2 - col) for row in range(3) for col in range(3)],     # Rotate 180 degrees
+              [col * 3 + (2 - row) for row in range(3) for col in range(3)],           # Rotate 270 degrees
+              [row * 3 + (2 - col) for row in range(3) for col in range(3)],           # Reflect left to right
+              [(2 - row) * 3 + col for row in range(3) for col in range(3)],           # Reflect top to bottom
+              [col * 3 + row for row in range(3) for col in range(3)],                 # Reflect in the main diagonal
+              [(2 - col) * 3 + (2 - row) for row in range(3) for col in range(3)]]     # Reflect in the other diagonal
+
+# symmetryKeys[s][mask] is the contribution of a set of counters to the base 3 key once the board is transformed by s.
+# Like the other tables below, it is filled in the first time it is needed rather than when the file is imported
+symmetryKeys = None
+
+def buildSymmetryKeys():
+    global symmetryKeys
+    symmetryKeys = [[sum(powersOfThree[cell] for cell in range(9) if (mask & cellBits[symmetry[cell]])) for mask in range(512)]
+                    for symmetry in symmetries]
+
+def keyCounters(key):
+    # Returns the counters of O and X on the 3x3 board with the given key
+    noughts = 0
+    crosses = 0
+    for cell in range(9):
+        piece = key // powersOfThree[cell] % 3
+        if (piece == 1): noughts = noughts | cellBits[cell]
+        elif (piece == 2): crosses = crosses | cellBits[cell]
+    return noughts, crosses
+
+def symmetricKeys(key):
+    # Returns the keys of the 8 rotations and reflections of the board with the given key
+    if (symmetryKeys is None): buildSymmetryKeys()
+    noughts, crosses = keyCounters(key)
+    return [symmetryKeys[s][noughts] + 2 * symmetryKeys[s][crosses] for s in range(8)]
+
+def canonicalKey(key):
+    # Returns the lowest key out of the 8 rotations and reflections of the board with the given key
+    return min(symmetricKeys(key))
+
+def numberCanonicalStates():
+    # Walks every board that can be reached in a game, giving each canonical board a dense id in the order they are found.
+    # Returns a table of the id for each key (-1 if the board can't be reached) and the number of ids
+    ids = [-1 for i in range(3**9)]
+    canonicalIds = {}
+    toVisit = [Board()]
+    while (len(toVisit) > 0):
+        board = toVisit.pop()
+        if (ids[board.key] != -1): continue
+
+        canonical = canonicalKey(board.key)
+        if (canonical not in canonicalIds): canonicalIds[canonical] = len(canonicalIds)
+        ids[board.key] = canonicalIds[canonical]
+
+        # Carry on from any board that isn't finished
+        occupied = board.counters["O"] | board.counters["X"]
+        if (victoryTable[board.counters["O"]] or victoryTable[board.counters["X"]] or occupied == 0b111111111): continue
+        Me = "O" if (counterCounts[occupied] % 2 == 0) else "X"
+        for cell in range(9):
+            if (occupied & cellBits[cell] == 0):
+                board2 = copyBoard(board)
+                placeCounter(board2, cell, Me)
+                toVisit.append(board2)
+
+    return ids, len(canonicalIds)
+
+stateIds = None
+numStates = None
+
+def numberStates():
+    # Numbers the canonical states the first time they are needed.  Every board reached in a 3x3 game has its own id, so
+    # they don't need to share entries in the statevalues
+    global stateIds, numStates
+    if (stateIds is not None): return
+    stateIds, numStates = numberCanonicalStates()
+    standardGeometry.stateIds = stateIds
+    standardGeometry.numStates = numStates
+
+def cellSymbol(board, cell):
+    # Returns the symbol shown in a given cell
+    if (board.counters["O"] & board.geometry.cellBits[cell]): return "O"
+    elif (board.counters["X"] & board.geometry.cellBits[cell]): return "X"
+    return " "
 
 def printBoard(board):
-    # Prints the current state of the board to the screen
-    print(" " + str(board[0][0]) + " | " + str(board[0][1]) + " | " + str(board[0][2]))
-    print("-----------")
-    print(" " + str(board[1][0]) + " | " + str(board[1][1]) + " | " + str(board[1][2]))
-    print("-----------")
-    print(" " + str(board[2][0]) + " | " + str(board[2][1]) + " | " + str(board[2][2]) + "\n")
-
-def checkEqual(lst):
-    # Checks to see if all elements in a given list are equal
-    for item in range(3):
-        if (lst[item] == " "): 
-            # We want to avoid returning false winners for an empty row
-            return False
-
-    # This will return true if the subset of items removing the first element is the same as the subset of items removing the last indicating that all elements are equal
-    return lst[1:] == lst[:-1] 
-
-def checkVictory(board):
-    # Checks the current state of the board to see if anyone has won
+    # Prints the current state of the board to the screen, one row at a time with a line of dashes between the rows
+    geometry = board.geometry
+    rows = [" " + " | ".join(cellSymbol(board, row * geometry.cols + col) for col in range(geometry.cols)) for row in range(geometry.rows)]
+    print(("\n" + "-" * (4 * geometry.cols - 1) + "\n").join(rows) + "\n")
+
+def checkVictory(board, cell=None, Me=None):
+    # Checks the current state of the board to see if anyone has won.  If the cell and player of the last move are given
+    # we only need to check the lines through that cell, as they are the only ones the move could have completed
     #############################################
     # Possible victories:
     #
@@ -31,58 +322,29 @@ def checkVictory(board):
     #  - | - | -    O | - | -    - | X | -
     # -----------  -----------  -----------
     #  - | - | -    O | - | -    - | - | X
-    #      3            3            2 
+    #      3            3            2
     #
-    # We will check each list in turn
+    # Every combination has already been checked for every set of counters in victoryTable on the 3x3 board
     #############################################
 
-    # This will check each row
-    for row in range(3):
-        Victory = checkEqual([board[row][0], board[row][1], board[row][2]])
-        if (Victory == True): 
-            # We have found a winner, return the symbol for the winning player.
-            if (cfg_DebugStatements == True): print("Winner!")
-            return board[row][0]
-
-    # This will check each column
-    for col in range(3):
-        Victory = checkEqual([board[0][col], board[1][col], board[2][col]])
-        if (Victory == True): 
-            # We have found a winner, return the symbol for the winning player.
-            if (cfg_DebugStatements == True): print("Winner!")
-            return board[0][col]
-
-    # Now check the two diagonals
-    Victory = checkEqual([board[0][0], board[1][1] ,board[2][2]])
-    if (Victory == True): 
-        # We have found a winner, return the symbol for the winning player.
-        if (cfg_DebugStatements == True): print("Winner!")
-        return board[0][0]
-
-    Victory = checkEqual([board[0][2], board[1][1] ,board[2][0]])
-    if (Victory == True): 
-        # We have found a winner, return the symbol for the winning player.
-        if (cfg_DebugStatements == True): print("Winner!")
-        return board[0][2]
+    geometry = board.geometry
+    if (cell is not None):
+        if (geometry.completesLine(board.counters[Me], cell) == True): return Me
+        return "No Winner"
+
+    if (geometry.hasLine(board.counters["O"]) == True): return "O"
+    if (geometry.hasLine(board.counters["X"]) == True): return "X"
 
     # If we reach this point then we have no winner
     return "No Winner"
 
 def getRandomCell(board):
-    # Pick a random cell and test if it has been used yet.  When we find an empty cell, place our move
-    valid = False
-    if (cfg_DebugStatements == True): print("    Checking move")
-    while valid == False:
-        row = math.floor(random() * 3)
-        col = math.floor(random() * 3)
-        if (board[row][col] == " "): 
-            # If the cell is empty then we have a valid move!
-            if (cfg_DebugStatements == True): print("    Move is valid!") 
-            valid = True
-            
-    return row, col
-
-def checkWinningCell(board, Me, Enemy, debugText):
+    # Pick one of the empty cells at random.  Picking straight from the list of empty cells means we never have to pick again
+    # because a cell has already been used
+    cells = board.geometry.emptyCells(board.counters["O"] | board.counters["X"])
+    return cells[math.floor(random() * len(cells))]
+
+def checkWinningCell(board, Me, Enemy):
     # As with checkVictory here is a list of winning combinations that we need to block
     #############################################
     # Possible victories:
@@ -92,400 +354,660 @@ def checkWinningCell(board, Me, Enemy, debugText):
     #  - | - | -    O | - | -    - | X | -
     # -----------  -----------  -----------
     #  - | - | -    O | - | -    - | - | X
-    #      3            3            2 
+    #      3            3            2
     #
-    # We will check each list in turn
+    # The first of these that we can complete has already been found for every 3x3 board in winningCells
     #############################################
 
-    # This will check each row
-    for row in range(3):
-        NumEnemy = [board[row][0], board[row][1], board[row][2]].count(Enemy)
-        NumMe = [board[row][0], board[row][1], board[row][2]].count(Me)
-        if (NumMe == 2 and NumEnemy == 0): 
-            if (cfg_DebugStatements == True): print(debugText)
-            return row, board[row].index(" ")
-
-    # Now check each column
-    for col in range(3):
-        NumEnemy = [board[0][col], board[1][col], board[2][col]].count(Enemy)
-        NumMe = [board[0][col], board[1][col], board[2][col]].count(Me)
-        if (NumMe == 2 and NumEnemy == 0): 
-            if (cfg_DebugStatements == True): print(debugText)
-            return [board[0][col], board[1][col], board[2][col]].index(" "), col
-
-
-    # Now check the two diagonals
-    NumEnemy = [board[0][0], board[1][1] ,board[2][2]].count(Enemy)
-    NumMe = [board[0][0], board[1][1] ,board[2][2]].count(Me)
-    if (NumMe == 2 and NumEnemy == 0): 
-        if (cfg_DebugStatements == True): print(debugText)
-        return [board[0][0], board[1][1], board[2][2]].index(" "), [board[0][0], board[1][1], board[2][2]].index(" ")
-    
-    NumEnemy = [board[0][2], board[1][1], board[2][0]].count(Enemy)
-    NumMe = [board[0][2], board[1][1], board[2][0]].count(Me)
-    if (NumMe == 2 and NumEnemy == 0): 
-        if (cfg_DebugStatements == True): print(debugText)
-        return [board[0][2], board[1][1], board[2][0]].index(" "), [board[2][0], board[1][1], board[0][2]].index(" ")
+    return board.geometry.winningCell(board, Me)
 
-    return -1, -1
-    
 def emptyCells(board):
     # Calculate the number of empty cells on a given board
-    blanks = 0
-    for row in range(3):
-        for col in range(3):
-            if (board[row][col] == " "): blanks = blanks + 1
-    
-    return blanks
+    return board.geometry.cells - bin(board.counters["O"] | board.counters["X"]).count("1")
 
 def generateStaticProbabilities(board):
     # Initially we will use a 'dumb' method just using the probability that each cell is part of a winning combination
-    
-    # The corners each appear in 3 winning sets
-    staticProbs[0][0] = 3
-    staticProbs[0][2] = 3
-    staticProbs[2][0] = 3
-    staticProbs[2][2] = 3
-
-    # The middle of a row/column each appear in 2 winning sets
-    staticProbs[0][1] = 2
-    staticProbs[1][0] = 2
-    staticProbs[1][2] = 2
-    staticProbs[2][1] = 2
-
-    # The central cell appears in 4 winning sets
-    staticProbs[1][1] = 4
-
-    # We will then scale these by the total number of cells used in all possible winning combinations
-    for row in range(3):
-        for col in range(3):
-            staticProbs[row][col] = staticProbs[row][col] / 24
+    geometry = board.geometry
+    staticProbs = [0 for cell in range(geometry.cells)]
+
+    # On the 3x3 board the corners each appear in 3 winning sets, the middle of a row/column each appear in 2 winning sets and the central cell appears in 4 winning sets
+    for cell in range(geometry.cells):
+        staticProbs[cell] = len(geometry.cellLines[cell])
+
+    # We will then scale these by the total number of cells used in all possible winning combinations (24 on the 3x3 board)
+    for cell in range(geometry.cells):
+        staticProbs[cell] = staticProbs[cell] / (geometry.k * len(geometry.lines))
 
     # Now turn these into a cumulative probability.
-    
-    for row in range(3):
-        for col in range(3):
-            if (row == 0 and col == 0):
-                staticProbs[row][col] = staticProbs[row][col] + 0
-            elif (col == 0):
-                staticProbs[row][col] = staticProbs[row][col] + staticProbs[row - 1][2]
-            else:
-                staticProbs[row][col] = staticProbs[row][col] + staticProbs[row][col - 1]
+    for cell in range(geometry.cells):
+        if (cell == 0):
+            staticProbs[cell] = staticProbs[cell] + 0
+        else:
+            staticProbs[cell] = staticProbs[cell] + staticProbs[cell - 1]
 
-            if (cfg_DebugStatements == True): print("    " + str(staticProbs[row][col]))
+    return staticProbs
 
 def generateDynamicProbabilities(board, Me, Enemy):
     # Here we want to account for certain cells being taken already, denying a potential winning combination
     # Check each winning combination for an enemy counter
 
+    geometry = board.geometry
     TotalWinningCells = 0
+    dynamicProbs = [0 for cell in range(geometry.cells)]
 
-    # This will check each row
-    for row in range(3):
-        enemyCounters = [board[row][0], board[row][1], board[row][2]].count(Enemy)
-        if (enemyCounters == 0):
-            TotalWinningCells = TotalWinningCells + 3
-            for col in range(3):
-                dynamicProbs[row][col] = dynamicProbs[row][col] + 1
-
-    # This will check each column
-    for col in range(3):
-        enemyCounters = [board[0][col], board[1][col], board[2][col]].count(Enemy)
-        if (enemyCounters == 0):
-            TotalWinningCells = TotalWinningCells + 3
-            for row in range(3):
-                dynamicProbs[row][col] = dynamicProbs[row][col] + 1
-
-    # Now check the two diagonals
-    enemyCounters = [board[0][0], board[1][1], board[2][2]].count(Enemy)
-    if (enemyCounters == 0):
-        TotalWinningCells = TotalWinningCells + 3
-        for row in range(3):
-            dynamicProbs[row][row] = dynamicProbs[row][row] + 1
-
-    enemyCounters = [board[0][2], board[1][1], board[2][0]].count(Enemy)
-    if (enemyCounters == 0):
-        TotalWinningCells = TotalWinningCells + 3
-        for row in range(3):
-            dynamicProbs[row][2 - row] = dynamicProbs[row][2 - row] + 1
-
-
-    for row in range(3):
-        for col in range(3):
-            if (TotalWinningCells > 0): dynamicProbs[row][col] = dynamicProbs[row][col] / TotalWinningCells
-
-    for row in range(3):
-        for col in range(3):
-            if (row == 0 and col == 0):
-                dynamicProbs[row][col] = dynamicProbs[row][col] + 0
-            elif (col == 0):
-                dynamicProbs[row][col] = dynamicProbs[row][col] + dynamicProbs[row - 1][2]
-            else:
-                dynamicProbs[row][col] = dynamicProbs[row][col] + dynamicProbs[row][col - 1]
+    for line in range(len(geometry.lines)):
+        if (board.counters[Enemy] & geometry.lines[line] == 0):
+            TotalWinningCells = TotalWinningCells + geometry.k
+            for cell in geometry.lineCells[line]:
+                dynamicProbs[cell] = dynamicProbs[cell] + 1
+
+    for cell in range(geometry.cells):
+        if (TotalWinningCells > 0): dynamicProbs[cell] = dynamicProbs[cell] / TotalWinningCells
+
+    for cell in range(geometry.cells):
+        if (cell == 0):
+            dynamicProbs[cell] = dynamicProbs[cell] + 0
+        else:
+            dynamicProbs[cell] = dynamicProbs[cell] + dynamicProbs[cell - 1]
 
-            if (cfg_DebugStatements == True): print("    " + str(dynamicProbs[row][col]))
+    return dynamicProbs
 
-def generateMLProbabilities(board) :
+def generateMLProbabilities(board, scores):
     # From the score that each cell has we will create a probability of placing our counter there
+    cellBits = board.geometry.cellBits
+    occupied = board.counters["O"] | board.counters["X"]
+    mlProbs = [0 for cell in cellBits]
 
     # Work out the total score of all available cells
     TotalScore = 0
-    for row in range(3):
-        for col in range(3):
-            if (board[row][col] == " "): TotalScore = TotalScore + scores[row][col]
-    
-    if (cfg_DebugStatements == True): print("    Total Score:" + str(TotalScore))
+    for cell in range(len(cellBits)):
+        if (occupied & cellBits[cell] == 0): TotalScore = TotalScore + scores[cell]
+
     # Now use this to create the probability assigned to each cell
-    for row in range(3):
-        for col in range(3):
-            if (board[row][col] == " "):
-                mlProbs[row][col] = scores[row][col] / TotalScore
-            else: mlProbs[row][col] = 0
+    for cell in range(len(cellBits)):
+        if (occupied & cellBits[cell] == 0):
+            mlProbs[cell] = scores[cell] / TotalScore
+        else: mlProbs[cell] = 0
+
+    for cell in range(len(cellBits)):
+        if (cell == 0):
+            mlProbs[cell] = mlProbs[cell] + 0
+        else:
+            mlProbs[cell] = mlProbs[cell] + mlProbs[cell - 1]
 
-    
-    for row in range(3):
-        for col in range(3):
-            if (row == 0 and col == 0):
-                mlProbs[row][col] = mlProbs[row][col] + 0
-            elif (col == 0):
-                mlProbs[row][col] = mlProbs[row][col] + mlProbs[row - 1][2]
-            else:
-                mlProbs[row][col] = mlProbs[row][col] + mlProbs[row][col - 1]
+    return mlProbs
 
 def getProbabilityCell(board, probabilities):
-    valid = False
-    while (valid == False):
-        cell = random()
-        for row in range(3):
-            for col in range(3):
-                if (probabilities[row][col] > cell and board[row][col] == " "): 
-                    if (cfg_DebugStatements == True): 
-                        print("    Cell: " + str(cell))
-                        print("    Row " + str(row) + " Col: " + str(col))
-                    
-                    return row, col 
-
-    return -1, -1
+    # Picks the first empty cell whose cumulative probability is higher than a random draw, so each empty cell also takes the
+    # probability of any used cells just before it.  If the draw is higher than the cumulative probability of the last empty
+    # cell then no cell could be picked and we would have to draw again.  Scaling the draw by that cumulative probability
+    # gives the same chance for each cell with a single draw.
+    cells = board.geometry.emptyCells(board.counters["O"] | board.counters["X"])
+    draw = random() * probabilities[cells[-1]]
+    for cell in cells:
+        if (probabilities[cell] > draw): return cell
+
+    # None of the empty cells have any probability, so pick one at random
+    return getRandomCell(board)
 
 def translateBoardSate(board):
-    # We will use a key to define each board state.  If a cell is empty then we assign a value of 0, O = 1 and X = 2
-    
-    boardKey = 0 
-    for row in range(3):
-        for col in range(3):
-            cellkey = row * 3 + col
-            if (board[row][col] == "O"): boardKey = boardKey + 1 * 3**cellkey
-            elif (board[row][col] == "X"): boardKey = boardKey + 2 * 3**cellkey
+    # We will use a key to define each board state.  On the 3x3 board if a cell is empty then we assign a value of 0, O = 1
+    # and X = 2.  The key is kept up to date by placeCounter so there is no need to look at each cell again
+    return board.key
+
+#############################################
+# Perfect Play
+#############################################
+# The whole game tree is small enough to solve exactly.  We use negamax, where the value of a board is always from the point
+# of view of the player about to move, so a player's value is the negative of their opponent's best reply.  A win is worth
+# more the sooner it comes: 10 less the number of counters on the board after the winning move.
+#
+# Alpha-beta pruning stops looking at moves once we know they can't change the result, so a value can be exact or just a
+# bound.  Every value is stored in a transposition table indexed by the board key so each board is only searched once.
+#############################################
 
-    return boardKey
+solverExact = 0
+solverLowerBound = 1
+solverUpperBound = 2
+
+# We try the centre first, then the corners and then the edges as these are most likely to be the best moves
+solverMoveOrder = [4, 0, 2, 6, 8, 1, 3, 5, 7]
+
+transpositionTable = None
+perfectCells = None
+
+def negamax(board, Me, Enemy, alpha, beta):
+    # Returns the value of the board for the player about to move
+    entry = transpositionTable[board.key]
+    if (entry is not None):
+        value, bound = entry
+        if (bound == solverExact): return value
+        elif (bound == solverLowerBound and value >= beta): return value
+        elif (bound == solverUpperBound and value <= alpha): return value
+
+    occupied = board.counters["O"] | board.counters["X"]
+    if (occupied == 0b111111111):
+        # The board is full without a winner
+        transpositionTable[board.key] = (0, solverExact)
+        return 0
+
+    alphaOriginal = alpha
+    bestValue = -10
+    for cell in solverMoveOrder:
+        if (occupied & cellBits[cell] == 0):
+            placeCounter(board, cell, Me)
+            if (victoryTable[board.counters[Me]] == True): value = 10 - counterCounts[occupied] - 1
+            else: value = -negamax(board, Enemy, Me, -beta, -alpha)
+            removeCounter(board, cell, Me)
+
+            if (value > bestValue): bestValue = value
+            if (value > alpha): alpha = value
+            if (alpha >= beta): break
+
+    if (bestValue <= alphaOriginal): transpositionTable[board.key] = (bestValue, solverUpperBound)
+    elif (bestValue >= beta): transpositionTable[board.key] = (bestValue, solverLowerBound)
+    else: transpositionTable[board.key] = (bestValue, solverExact)
+
+    return bestValue
+
+def solveGame():
+    # Works out the best moves for every board that can be reached in a game, so each perfect move is just a lookup
+    global perfectCells, transpositionTable
+    perfectCells = [None for i in range(3**9)]
+    if (transpositionTable is None): transpositionTable = [None for i in range(3**9)]
+
+    solveBoard(Board(), cfg_Player1, cfg_Player2)
+
+def solveBoard(board, Me, Enemy):
+    # Finds the best moves for the board (with Me to move) and then for every board they lead to that isn't finished.
+    # Each move is made on the board and taken back again, so only one board is used for the whole game
+    if (perfectCells[board.key] is not None): return
+
+    # Find the exact value of every move, keeping all of the moves that share the best value
+    occupied = board.counters["O"] | board.counters["X"]
+    bestValue = -11
+    bestCells = []
+    for cell in range(9):
+        if (occupied & cellBits[cell] == 0):
+            placeCounter(board, cell, Me)
+            if (victoryTable[board.counters[Me]] == True): value = 10 - counterCounts[occupied] - 1
+            else: value = -negamax(board, Enemy, Me, -10, 10)
+            removeCounter(board, cell, Me)
+
+            if (value > bestValue):
+                bestValue = value
+                bestCells = [cell]
+            elif (value == bestValue): bestCells.append(cell)
+
+    perfectCells[board.key] = bestCells
+
+    for cell in range(9):
+        if (occupied & cellBits[cell] == 0 and occupied | cellBits[cell] != 0b111111111):
+            placeCounter(board, cell, Me)
+            if (victoryTable[board.counters[Me]] == False): solveBoard(board, Enemy, Me)
+            removeCounter(board, cell, Me)
+
+def getPerfectCell(board):
+    # Picks one of the best moves at random
+    if (perfectCells is None): solveGame()
+    cells = perfectCells[board.key]
+    return cells[math.floor(random() * len(cells))]
 
-def makeMove(board, Me, Enemy, strategy, moveList):
-    # Places a move onto the board based on the selected strategy
+#############################################
+# Strategies
+#############################################
+# Each strategy is a class with two hooks that are called while a game is played:
+#
+#   choose_move(game) returns the cell to place a counter in for the player about to move (game.me)
+#   observe_result(game) is called once the game is over, so the learning strategies can learn from it
+#
+# Anything a strategy learns is kept on the strategy object rather than in module globals, so games played with different
+# strategy objects (in other threads or processes) never share any state.  Strategies are registered by name so they can
+# be created from the strategies list, and can also pick moves for the batch engine with choose_batch_moves.
+#
+# Each strategy is created for a board geometry (3x3 unless another is given) and can only play games on that geometry.
+# The batch engine and the Perfect and Tablebase strategies only work on the 3x3 board.
+#############################################
 
-    if (cfg_DebugStatements == True): print("Player: " + Me)
-    
-    if (strategy == "Random"):     
-        # Random strategy
-        row, col = getRandomCell(board)
-        if (cfg_DebugStatements == True): print("Row: " + str(row) + " Col: " + str(col))
-        board[row][col] = Me
-    elif (strategy == "WinRandom"):
-        # Check to see if we have a winning move
-        row, col = checkWinningCell(board, Me, Enemy, "    Winning Move!")
-
-        if (cfg_DebugStatements == True): 
-            if (row == -1) : print("    No winning move found")
-            else: print("    Row: " + str(row) + " Col: " + str(col))
-
-        if (row == -1):
-            # If there was no winning move then play a random move
-            row, col = getRandomCell(board)
-
-            if (cfg_DebugStatements == True): 
-                if (row == -1) : print("    No winning move found")
-                else: print("    Row: " + str(row) + " Col: " + str(col))
-
-        board[row][col] = Me
-    elif (strategy == "BlockRandom"):
-        # Check to see if we have a winning move
-        row, col = checkWinningCell(board, Me, Enemy, "    Winning Move!")
-        
-        if (cfg_DebugStatements == True): 
-            if (row == -1) : print("    No winning move found")
-            else: print("    Row: " + str(row) + " Col: " + str(col))
-
-        if (row == -1): 
-            # We can check for a winning move 'pretending' that we are the enemy player to see if we need to block
-            row, col = checkWinningCell(board, Enemy, Me, "    Block Needed!") 
-
-            if (cfg_DebugStatements == True): 
-                if (row == -1) : print("    No blocking move found")
-                else: print("    Row: " + str(row) + " Col: " + str(col))
-            
-        if (row == -1):
-            # If we didn't need to block then make a random move
-            row, col = getRandomCell(board)
-            
-            if (cfg_DebugStatements == True): 
-                if (row == -1) : print("    No winning move found")
-                else: print("    Row: " + str(row) + " Col: " + str(col))
-
-        board[row][col] = Me
-    elif (strategy == "StaticProbability"):
-        # We will first check winning/blocking moves as above
-        # If these aren't suffice to select a cell we will use a probability
-        # We will calculate a probability for each empty cell that it is part of a winning board for us
-
-        # Check to see if we have a winning move
-        row, col = checkWinningCell(board, Me, Enemy, "    Winning Move!")
-        
-        if (cfg_DebugStatements == True): 
-            if (row == -1) : print("    No winning move found")
-            else: print("    Row: " + str(row) + " Col: " + str(col))
-
-        if (row == -1): 
-            # We can check for a winning move 'pretending' that we are the enemy player to see if we need to block
-            row, col = checkWinningCell(board, Enemy, Me, "    Block Needed!") 
-
-            if (cfg_DebugStatements == True): 
-                if (row == -1) : print("    No blocking move found")
-                else: print("    Row: " + str(row) + " Col: " + str(col))
-        
-        if (row == -1):
-            # The static probabilities never change, so we only need to do this once! 
-            if (staticProbs[0][0] == 0): generateStaticProbabilities(board)
-
-            row, col = getProbabilityCell(board, staticProbs)
-        board[row][col] = Me
-    elif (strategy == "DynamicProbability"):
-        # We will first check winning/blocking moves as above
-        # If these aren't suffice to select a cell we will use a probability
-        # We will calculate a probability for each empty cell that it is part of a winning board for us
-
-        # Check to see if we have a winning move
-        row, col = checkWinningCell(board, Me, Enemy, "    Winning Move!")
-        
-        if (cfg_DebugStatements == True): 
-            if (row == -1) : print("    No winning move found")
-            else: print("    Row: " + str(row) + " Col: " + str(col))
-
-        if (row == -1): 
-            # We can check for a winning move 'pretending' that we are the enemy player to see if we need to block
-            row, col = checkWinningCell(board, Enemy, Me, "    Block Needed!") 
-
-            if (cfg_DebugStatements == True): 
-                if (row == -1) : print("    No blocking move found")
-                else: print("    Row: " + str(row) + " Col: " + str(col))
-        
-        if (row == -1):
-            # The dynamic probabilities change with every move
-            generateDynamicProbabilities(board, Me, Enemy)
-
-            row, col = getProbabilityCell(board, dynamicProbs)
-        board[row][col] = Me
-    elif (strategy == "ReinforcedLearning1"):
-        # This strategy doesn't understand how to win or prevent the opponent from winning so just picks a cell based on the mlProbs list
-        if (cfg_DebugStatements == True): print("    Making ML Move")
-        generateMLProbabilities(board)
-        if (cfg_DebugStatements == True): 
-            for row in range(3):
-                for col in range(3):
-                    print("    Prob for " + str(row) + ", " + str(col) + ": " + str(mlProbs[row][col]))
-        row, col = getProbabilityCell(board, mlProbs)
-    elif (strategy == "ReinforcedLearning2"):
-        # Here we will consider each move that we can make and pick the one that returns the highest value 
-        bestrow = 0
-        bestcol = 0
-        maxState = -1
-        board2 = []
-
-        for row in range(3):
-            for col in range(3):
-                board2 = deepcopy(board)
-                if (board2[row][col] == " "):
-                    board2[row][col] = Me
-                    testState = translateBoardSate(board2)
-                    if (statevalues[testState] > maxState):
-                        bestrow = row
-                        bestcol = col
-                        maxState = statevalues[testState]
-                board2 = []
-
-        row = bestrow
-        col = bestcol
-
-    board[row][col] = Me
-
-    # Add the move to the movelist
-    boardKey = translateBoardSate(board)
-    moveList.append(boardKey)
-
-def updateScores(board, Me):
+strategyClasses = {}
+
+def registerStrategy(strategyClass):
+    # Makes a strategy available by its name
+    strategyClasses[strategyClass.name] = strategyClass
+    return strategyClass
+
+def makeStrategies(names, geometry=None):
+    # Creates one strategy object for each name
+    return {name: strategyClasses[name](geometry) for name in names}
+
+def makePlayers(names, geometry=None):
+    # Creates the strategies for the given names along with the learning strategies and the opponent they train against,
+    # which are always needed to train and to save or load the learned tables
+    return makeStrategies(list(dict.fromkeys(list(names) + trainingstrategies + ["DynamicProbability"])), geometry)
+
+class Strategy:
+    name = None
+
+    def __init__(self, geometry=None):
+        self.geometry = standardGeometry if (geometry is None) else geometry
+
+    def choose_move(self, game):
+        raise NotImplementedError
+
+    def observe_result(self, game):
+        pass
+
+    def prepare_batch(self):
+        # Called before the strategy plays any batch games, to build any tables choose_batch_moves needs
+        pass
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        raise ValueError("No batch implementation for strategy: " + str(self.name))
+
+    def observe_batch(self, boards, winners, moveKeys, td=None):
+        # The batch version of observe_result, called with the results of a batch of games from playBatchGames
+        pass
+
+@registerStrategy
+class RandomStrategy(Strategy):
+    # Picks any empty cell at random
+    name = "Random"
+
+    def choose_move(self, game):
+        return getRandomCell(game.board)
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchTableCells(keys, batchRandomTable, rng)
+
+@registerStrategy
+class WinRandomStrategy(Strategy):
+    # Plays a winning move if there is one, otherwise a random move
+    name = "WinRandom"
+
+    def choose_move(self, game):
+        board = game.board
+        cell = board.geometry.winningCell(board, game.me)
+        if (cell == -1): cell = getRandomCell(board)
+        return cell
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchWinBlockCells(keys, Me, Enemy, False, batchRandomTable, rng)
+
+@registerStrategy
+class BlockRandomStrategy(Strategy):
+    # Plays a winning move if there is one, then blocks the enemy if they could win, otherwise plays a random move
+    name = "BlockRandom"
+
+    def choose_move(self, game):
+        board = game.board
+        cell = board.geometry.winningCell(board, game.me)
+        if (cell == -1): cell = board.geometry.winningCell(board, game.enemy)
+        if (cell == -1): cell = getRandomCell(board)
+        return cell
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchWinBlockCells(keys, Me, Enemy, True, batchRandomTable, rng)
+
+@registerStrategy
+class StaticProbabilityStrategy(Strategy):
+    # Wins or blocks as BlockRandom, otherwise picks a cell with a probability based on how many winning combinations it is in
+    name = "StaticProbability"
+
+    def choose_move(self, game):
+        board = game.board
+        cell = board.geometry.winningCell(board, game.me)
+        if (cell == -1): cell = board.geometry.winningCell(board, game.enemy)
+        if (cell == -1): cell = board.geometry.staticCell(board)
+        return cell
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchWinBlockCells(keys, Me, Enemy, True, batchStaticTable, rng)
+
+@registerStrategy
+class DynamicProbabilityStrategy(Strategy):
+    # Wins or blocks as BlockRandom, otherwise picks a cell with a probability based on how many winning combinations it is
+    # in that the enemy hasn't already blocked
+    name = "DynamicProbability"
+
+    def choose_move(self, game):
+        board = game.board
+        cell = board.geometry.winningCell(board, game.me)
+        if (cell == -1): cell = board.geometry.winningCell(board, game.enemy)
+        if (cell == -1): cell = board.geometry.dynamicCell(board, game.me)
+        return cell
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchWinBlockCells(keys, Me, Enemy, True, batchDynamicTable[pieceValues[Me]], rng)
+
+@registerStrategy
+class ReinforcedLearning1Strategy(Strategy):
+    # Picks a cell with a probability based on its score, where the cells used by the winner of each game score more.
+    # This strategy doesn't understand how to win or prevent the opponent from winning
+    name = "ReinforcedLearning1"
+
+    def __init__(self, geometry=None):
+        Strategy.__init__(self, geometry)
+        self.scores = [100 for cell in range(self.geometry.cells)]
+
+    def choose_move(self, game):
+        return getProbabilityCell(game.board, generateMLProbabilities(game.board, self.scores))
+
+    def observe_result(self, game):
+        updateScores(self.scores, game.board, game.winner)
+
+    def observe_batch(self, boards, winners, moveKeys, td=None):
+        # There are no boards to learn values for, so the scores are updated the same way with or without TD learning
+        self.scores[:] = batchUpdateScores(self.scores, boards, winners).tolist()
+
+    def prepare_batch(self):
+        # Only the scores of the empty cells count towards the probabilities
+        buildBatchTables()
+        self.batchTable = batchCumulativeTable(allBoards, np.where(allBoards == 0, np.array(self.scores, dtype=np.float64), 0))
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchTableCells(keys, self.batchTable, rng)
+
+@registerStrategy
+class ReinforcedLearning2Strategy(Strategy):
+    # Looks at the learned value of the board after each move it could make and picks the highest.  The value is shared by
+    # every rotation and reflection of the board, but we still pick the cell on the real board
+    name = "ReinforcedLearning2"
+
+    def __init__(self, geometry=None):
+        Strategy.__init__(self, geometry)
+        self.geometry.prepareStates()
+        self.statevalues = [100.0 for i in range(self.geometry.numStates)]
+
+    def choose_move(self, game):
+        board = game.board
+        statevalues = self.statevalues
+        ids = board.geometry.stateIds
+        bestcell = 0
+        maxState = -math.inf
+        for cell in board.geometry.emptyCells(board.counters["O"] | board.counters["X"]):
+            value = statevalues[ids[keyAfterMove(board, cell, game.me)]]
+            if (value > maxState):
+                bestcell = cell
+                maxState = value
+
+        return bestcell
+
+    def observe_result(self, game):
+        updateStateValues(self.statevalues, game.moveList, cfg_Player1, cfg_Player2, game.winner, game.board.geometry)
+
+    def observe_batch(self, boards, winners, moveKeys, td=None):
+        self.statevalues[:] = batchUpdateStateValues(self.statevalues, moveKeys, winners, td).tolist()
+
+    def prepare_batch(self):
+        # Boards that can't be reached in a game have no id, but they are never played so their value doesn't matter.
+        # Occupied cells are never picked, however low the values are, and a tie goes to the first cell, as in choose_move
+        buildBatchTables()
+        ids = batchStateIds
+        values = np.where(ids >= 0, np.array(self.statevalues, dtype=np.float64)[ids], 0)
+        empty = allBoards == 0
+        self.batchBestCells = np.zeros((3, 3**9), dtype=np.int8)
+        for piece in [1, 2]:
+            afterKeys = np.arange(3**9)[:, None] + piece * batchPowersOfThree * empty
+            self.batchBestCells[piece] = np.where(empty, values[afterKeys], -np.inf).argmax(axis=1)
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return self.batchBestCells[pieceValues[Me]][keys]
+
+@registerStrategy
+class PerfectStrategy(Strategy):
+    # Plays one of the best moves found by the solver
+    name = "Perfect"
+
+    def __init__(self, geometry=None):
+        Strategy.__init__(self, geometry)
+        if (self.geometry is not standardGeometry): raise ValueError("The Perfect strategy can only play on the 3x3 board")
+
+    def choose_move(self, game):
+        return getPerfectCell(game.board)
+
+    def prepare_batch(self):
+        if (perfectCells is None): solveGame()
+        buildBatchTables()
+        bestCells = np.zeros(allBoards.shape)
+        for key in range(3**9):
+            if (perfectCells[key] is not None): bestCells[key, perfectCells[key]] = 1
+        self.batchTable = batchCumulativeTable(allBoards, bestCells)
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchTableCells(keys, self.batchTable, rng)
+
+def updateScores(scores, board, Me):
     # We will update the scores for the ML model after each game
-    for row in range(3):
-        for col in range(3):
-            if (board[row][col] == Me): scores[row][col] = scores[row][col] + 5
-            elif (board[row][col] != Me and Me != "Draw"): 
-                scores[row][col] = scores[row][col] - 1
-                if (scores[row][col] == 0): 
-                    # Ensure a cell is never impossible to place a counter on
-                    scores[row][col] = 1
-
-def updateStateValues(moveList, Player1, Player2, Winner):
+    winnerCounters = board.counters.get(Me, 0)
+    cellBits = board.geometry.cellBits
+    for cell in range(board.geometry.cells):
+        if (winnerCounters & cellBits[cell]): scores[cell] = scores[cell] + 5
+        elif (Me != "Draw"):
+            scores[cell] = scores[cell] - 1
+            if (scores[cell] <= 0):
+                # Ensure a cell is never impossible to place a counter on (scores merged by averaging can be fractional)
+                scores[cell] = 1
+
+def updateStateValues(statevalues, moveList, Player1, Player2, Winner, geometry=standardGeometry):
+    geometry.prepareStates()
+    stateIds = geometry.stateIds
     for move in range(len(moveList)):
+        # On the 3x3 board all rotations and reflections of a board share the same value
+        state = stateIds[moveList[move]]
         if (move % 2 == 0):
             if (Winner == Player1):
-                statevalues[moveList[move]] = statevalues[moveList[move]] + 11
+                statevalues[state] = statevalues[state] + 11
             elif (Winner == Player2):
-                statevalues[moveList[move]] = statevalues[moveList[move]] - 5
-                if (statevalues[moveList[move]] < 0): statevalues[moveList[move]] = 1
+                statevalues[state] = statevalues[state] - 5
+                if (statevalues[state] < 0): statevalues[state] = 1
         else:
             if (Winner == Player2):
-                statevalues[moveList[move]] = statevalues[moveList[move]] + 11
+                statevalues[state] = statevalues[state] + 11
             elif (Winner == Player1):
-                statevalues[moveList[move]] = statevalues[moveList[move]] - 5
-                if (statevalues[moveList[move]] < 0): statevalues[moveList[move]] = 1
-
-def playGame(board, cfg_Player1Strategy, cfg_Player2Strategy):  
-    # Plays a game
-    winner = "No Winner"
-    moves = 0
-    moveList = []
-    while winner == "No Winner" and moves < 9: 
-        # We will keep allowing moves until there is either a winner or the board is full after 9 moves
-
-        if (moves % 2 == 0): 
-            # Make a move for player 1
-            makeMove(board, cfg_Player1, cfg_Player2, cfg_Player1Strategy, moveList)
-        else: 
-            # Make a move for player 2
-            makeMove(board, cfg_Player2, cfg_Player1, cfg_Player2Strategy, moveList)
-        
-        if (cfg_PrintBoard == True): print("Move: " + str(moves) + " (" + str(moveList[moves]) + ")\n")
-        if (cfg_PrintBoard == True): printBoard(board)
-        if (cfg_DebugStatements == True): print("Checking for a winner")
-        
-        winner = checkVictory(board)
-        if (cfg_DebugStatements == True): print(winner)
-        
-        # Increment the move count
-        moves = moves + 1
-    
-    # Final position
-    if (cfg_PrintResult == True):
-        if (winner in [cfg_Player1, cfg_Player2]): print(str(winner) + " won! Final position: ")
-        else: print("No Winner! Final position: ")
-        printBoard(board)
+                statevalues[state] = statevalues[state] - 5
+                if (statevalues[state] < 0): statevalues[state] = 1
 
-    if (cfg_Player1Strategy == "ReinforcedLearning1" or cfg_Player2Strategy == "ReinforcedLearning1"):
-        updateScores(board, winner)
+#############################################
+# Playing a Game
+#############################################
 
-    if (cfg_Player1Strategy == "ReinforcedLearning2" or cfg_Player2Strategy == "ReinforcedLearning2"):
-        updateStateValues(moveList, cfg_Player1, cfg_Player2, winner)
+def resolveChooseMove(strategy):
+    # Returns the function used to pick each move for a strategy.  Any debug output or profiling is added here, once per
+    # game, so that picking a move never has to check cfg_DebugStatements or whether profiling is enabled
+    chooseMove = strategy.choose_move
+
+    if (cfg_DebugStatements == True):
+        def debugChooseMove(game):
+            print("Player: " + game.me + " (" + str(strategy.name) + ")")
+            cell = strategy.choose_move(game)
+            print("    Row: " + str(cell // game.board.geometry.cols) + " Col: " + str(cell % game.board.geometry.cols))
+            return cell
+
+        chooseMove = debugChooseMove
+
+    if (profileStats is not None): chooseMove = profiled("makeMove:" + str(strategy.name), chooseMove)
+    return chooseMove
+
+class Game:
+    # A single game between two strategies.  The game owns its board, the cell of each move and the list of board keys
+    # after each move, and keeps track of whose turn it is so the strategies know which player they are.  If learn is
+    # False the strategies aren't told the result, so the game doesn't change anything they have learned.  The game is
+    # played on the geometry the strategies were created for
+    def __init__(self, player1Strategy, player2Strategy, learn=True):
+        if (player1Strategy.geometry is not player2Strategy.geometry):
+            raise ValueError("Both strategies must be created for the same board geometry")
+        self.board = Board(player1Strategy.geometry)
+        self.cells = []
+        self.moveList = []
+        self.winner = "No Winner"
+        self.me = cfg_Player1
+        self.enemy = cfg_Player2
+        self.strategies = [player1Strategy, player2Strategy]
+        self.learn = learn
+        self.chooseMoves = [resolveChooseMove(player1Strategy), resolveChooseMove(player2Strategy)]
+
+    def play(self):
+        # Plays the game to the end, returning the winner
+        board = self.board
+        cells = board.geometry.cells
+        moves = 0
+        while (self.winner == "No Winner" and moves < cells):
+            # We will keep allowing moves until there is either a winner or the board is full
+            cell = self.chooseMoves[moves % 2](self)
+            placeCounter(board, cell, self.me)
+            self.cells.append(cell)
+            self.moveList.append(board.key)
+
+            if (cfg_PrintBoard == True):
+                print("Move: " + str(moves) + " (" + str(board.key) + ")\n")
+                printBoard(board)
+
+            self.winner = checkVictory(board, cell, self.me)
+            self.me, self.enemy = self.enemy, self.me
+            moves = moves + 1
+
+        # Final position
+        if (cfg_PrintResult == True):
+            if (self.winner in [cfg_Player1, cfg_Player2]): print(str(self.winner) + " won! Final position: ")
+            else: print("No Winner! Final position: ")
+            printBoard(board)
+
+        # Let each strategy learn from the game, only once if it played both sides
+        if (self.learn == True):
+            self.strategies[0].observe_result(self)
+            if (self.strategies[1] is not self.strategies[0]): self.strategies[1].observe_result(self)
+        if (gameLog is not None): gameLog.write(self)
+
+        return self.winner
+
+    def replay(self, cells):
+        # Plays the given cells in order, as the moves of a logged game, without asking the strategies for any moves
+        for cell in cells:
+            placeCounter(self.board, cell, self.me)
+            self.cells.append(cell)
+            self.moveList.append(self.board.key)
+            self.me, self.enemy = self.enemy, self.me
+
+        self.winner = checkVictory(self.board)
+        return self.winner
+
+    def playMove(self, cell):
+        # Places a counter in the given cell for the player about to move and passes the turn, returning the winner so
+        # far.  This is for games that are played one move at a time from outside (such as by a client of server.py), so
+        # the strategies aren't told the result
+        placeCounter(self.board, cell, self.me)
+        self.cells.append(cell)
+        self.moveList.append(self.board.key)
+        self.winner = checkVictory(self.board, cell, self.me)
+        self.me, self.enemy = self.enemy, self.me
+        return self.winner
+
+def playGame(player1Strategy, player2Strategy, learn=True):
+    # Plays a game between two strategy objects, returning the winner
+    return Game(player1Strategy, player2Strategy, learn).play()
 
-    return winner
+#############################################
+# Profiling
+#############################################
+# enableProfiling swaps playGame, checkVictory, updateScores and updateStateValues for versions that count the calls and
+# time spent in them, and Game times the moves picked by each strategy.  Everything looks these functions up by name when
+# they are called, so when profiling is disabled the original functions are used and there is nothing to slow them down.
+#
+# profileStats maps each name to [calls, total nanoseconds].  The stats can be written out in the format cProfile saves
+# (so they can be read with pstats or any viewer that reads it), or as collapsed stacks for flamegraph.pl.
+#############################################
+
+profiledFunctions = ["playGame", "checkVictory", "updateScores", "updateStateValues"]
+unprofiledFunctions = {}
+profileStats = None
+
+def profiled(name, function):
+    # Wraps a function so each call is counted and timed under the given name
+    def timed(*args, **kwargs):
+        start = perf_counter_ns()
+        result = function(*args, **kwargs)
+        stat = profileStats.setdefault(name, [0, 0])
+        stat[0] = stat[0] + 1
+        stat[1] = stat[1] + perf_counter_ns() - start
+        return result
+
+    return timed
+
+def enableProfiling():
+    # Starts counting and timing the profiled functions and the moves picked by each strategy
+    global profileStats
+    if (profileStats is not None): return
+    profileStats = {}
+    for name in profiledFunctions:
+        unprofiledFunctions[name] = globals()[name]
+        globals()[name] = profiled(name, unprofiledFunctions[name])
+
+def disableProfiling():
+    # Puts the original functions back, returning the stats collected
+    global profileStats
+    stats = profileStats
+    for name in unprofiledFunctions:
+        globals()[name] = unprofiledFunctions[name]
+    unprofiledFunctions.clear()
+    profileStats = None
+    return stats
+
+def takeProfileStats():
+    # Returns the stats collected so far and starts again from zero, leaving profiling enabled
+    global profileStats
+    if (profileStats is None): return None
+    stats = profileStats
+    profileStats = {}
+    return stats
+
+def mergeProfileStats(stats, more):
+    # Adds the stats from more into stats
+    if (more is None): return stats
+    for name, (calls, total) in more.items():
+        stat = stats.setdefault(name, [0, 0])
+        stat[0] = stat[0] + calls
+        stat[1] = stat[1] + total
+    return stats
+
+def profileSelfTime(stats):
+    # Everything else is called from within playGame, so the time spent in playGame itself is what is left after
+    # taking off the time spent in the others
+    children = sum(total for name, (calls, total) in stats.items() if (name != "playGame"))
+    return max(stats.get("playGame", [0, 0])[1] - children, 0)
+
+def printProfileStats(stats, out=None):
+    # Prints the number of calls, total time and time per call for each name, slowest first, to out (stdout by default)
+    from prettytable import PrettyTable
+    t = PrettyTable(["Name", "Calls", "Total (s)", "Per Call (ns)"])
+    for name, (calls, total) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        t.add_row([name, calls, '%.3f' % (total / 1e9), '%.0f' % (total / max(calls, 1))])
+    print(t, file=out)
+
+def dumpProfileStats(stats, path):
+    # Writes the stats in the format saved by cProfile, so they can be loaded with pstats.Stats(path).  Each name is
+    # called from playGame, which gives viewers the same call tree as the game
+    def entry(name):
+        return ("TicTacToe.py", 0, name)
+
+    root = stats.get("playGame", [0, 0])
+    data = {entry("playGame"): (root[0], root[0], profileSelfTime(stats) / 1e9, root[1] / 1e9, {})}
+    for name, (calls, total) in stats.items():
+        if (name == "playGame"): continue
+        data[entry(name)] = (calls, calls, total / 1e9, total / 1e9, {entry("playGame"): (calls, calls, total / 1e9, total / 1e9)})
+
+    with open(path, "wb") as f:
+        marshal.dump(data, f)
+
+def dumpCollapsedStacks(stats, path):
+    # Writes the stats as collapsed stacks (one "playGame;name microseconds" line each), the input used by flamegraph.pl
+    with open(path, "w") as f:
+        f.write("playGame " + str(profileSelfTime(stats) // 1000) + "\n")
+        for name, (calls, total) in stats.items():
+            if (name != "playGame"): f.write("playGame;" + name + " " + str(total // 1000) + "\n")
 
 def printRecord(record):
+    # prettytable is only loaded once there is a table to print
+    from prettytable import PrettyTable
     t = PrettyTable(tableheader)
     for row in range(len(strategies)):
         rowdata = [strategies[row]]
@@ -494,28 +1016,25 @@ def printRecord(record):
         t.add_row(rowdata)
     print(t)
 
-def printStateValues(board, Me):
+def printStateValues(board, Me, statevalues):
     # Given a particular board state, print the statevalues for each move
-    board2 = []
-
-    for row in range(3):
-        for col in range(3):
-            board2 = deepcopy(board)
-            if (board2[row][col] == " "):
-                board2[row][col] = Me
-                testState = translateBoardSate(board2)
-                printBoard(board2)
-                print("Value: " + str(statevalues[testState]))
-            board2 = []
+    occupied = board.counters["O"] | board.counters["X"]
+    board.geometry.prepareStates()
 
-def loopGames(TrainingGames, TestingGames):
+    for cell in board.geometry.emptyCells(occupied):
+        testState = board.geometry.stateIds[keyAfterMove(board, cell, Me)]
+        placeCounter(board, cell, Me)
+        printBoard(board)
+        removeCounter(board, cell, Me)
+        print("Value: " + str(statevalues[testState]))
 
+def trainStrategies(players, TrainingGames):
+    # Train each of the learning strategies against DynamicProbability
     for strat in range(len(trainingstrategies)):
-        cfg_Player1Strategy = trainingstrategies[strat]
-        cfg_Player2Strategy = "DynamicProbability"
+        cfg_Player1Strategy = players[trainingstrategies[strat]]
+        cfg_Player2Strategy = players["DynamicProbability"]
         for _1 in range(TrainingGames):
-            board = [[" ", " ", " "],[" ", " ", " "],[" ", " ", " "]]
-            winner = playGame(board, cfg_Player1Strategy, cfg_Player2Strategy)
+            winner = playGame(cfg_Player1Strategy, cfg_Player2Strategy)
 
         # if (winner == cfg_Player1):
         #     player1 = player1 + 1
@@ -523,22 +1042,27 @@ def loopGames(TrainingGames, TestingGames):
         #     player2 = player2 + 1
         # else: draw = draw + 1
 
+def loopGames(players, TrainingGames, TestingGames, freeze=False, writer=None):
+    # Plays every pair of strategies against each other.  If freeze is True nothing the strategies have learned changes
+    # once they have been trained, so the games each pair plays first to learn from each other are skipped.  If a
+    # ResultWriter is given, the results are passed to it as they are played rather than printed at the end
+
+    trainStrategies(players, TrainingGames)
+
     for strat1 in range(len(strategies)):
         for strat2 in range(len(strategies)):
             player1 = 0
             player2 = 0
             draw = 0
-            cfg_Player1Strategy = strategies[strat1]
-            cfg_Player2Strategy = strategies[strat2]
+            cfg_Player1Strategy = players[strategies[strat1]]
+            cfg_Player2Strategy = players[strategies[strat2]]
 
-            for _1 in range(TrainingGames):
-                board = [[" ", " ", " "],[" ", " ", " "],[" ", " ", " "]]
-                winner = playGame(board, cfg_Player1Strategy, cfg_Player2Strategy)
+            if (freeze == False):
+                for _1 in range(TrainingGames):
+                    winner = playGame(cfg_Player1Strategy, cfg_Player2Strategy)
 
-            
             for _1 in range(TestingGames):
-                board = [[" ", " ", " "],[" ", " ", " "],[" ", " ", " "]]
-                winner = playGame(board, cfg_Player1Strategy, cfg_Player2Strategy)
+                winner = playGame(cfg_Player1Strategy, cfg_Player2Strategy, not freeze)
 
                 if (winner == cfg_Player1):
                     player1 = player1 + 1
@@ -547,19 +1071,1240 @@ def loopGames(TrainingGames, TestingGames):
                 else: draw = draw + 1
 
                 record[strat1][strat2] = '%03d' % player1  + " / " + '%03d' % draw + " / " + '%03d' % player2
+                if (writer is not None and _1 % 1000 == 999): writer.update(strat1, strat2, player1, draw, player2)
 
+            if (writer is not None): writer.update(strat1, strat2, player1, draw, player2, True)
             # print("Games won by " + str(cfg_Player1) + " (" + str(cfg_Player1Strategy) + "): " + str(player1) + "/" + str(NumGames))
             # print("Games won by " + str(cfg_Player2) + " (" + str(cfg_Player2Strategy) + "): " + str(player2) + "/" + str(NumGames))
             # print("Games drawn: " + str(draw) + "/" + str(NumGames))
-    printRecord(record)
+    if (writer is None): printRecord(record)
+    else: writer.finish()
     
 
+#############################################
+# Batch Games
+#############################################
+# Rather than playing one game at a time, we can hold a whole batch of boards in a single (N, 9) array where each cell is
+# 0 if it is empty, 1 for O and 2 for X, along with the key for each board.  Every board in the batch is advanced one move
+# at a time, with each strategy picking the moves for the whole batch in one go.
+#
+# There are only 3^9 board keys, so anything that only depends on the board (the winner, the winning cell for each player
+# and the probability of picking each empty cell) is worked out for every key up front.  Each move is then a handful of
+# array lookups and a single random draw per board.
+#
+# The learned strategies are frozen while the batch is played, so ReinforcedLearning1 and ReinforcedLearning2 use the
+# scores and statevalues they had when prepare_batch was called.
+#
+# The tables are built by buildBatchTables the first time anything uses the batch engine, so that importing this file
+# (and starting each worker process) stays quick.
+#############################################
+
+batchPowersOfThree = None
+lineMembership = None
+allBoards = None
+
+def batchLineCounts(boards, piece):
+    # Counts the number of counters of the given piece in each winning combination for every board in the batch
+    return (boards == piece).astype(np.float32) @ lineMembership.T
+
+def batchWinningCells(boards, mineCounts, enemyCounts):
+    # The batch equivalent of checkWinningCell, returning the cell that completes the first winning combination found
+    # for each board, or -1 if there isn't one
+    openLines = (mineCounts == 2) & (enemyCounts == 0)
+    firstLine = openLines.argmax(axis=1)
+    cells = ((lineMembership[firstLine] > 0) & (boards == 0)).argmax(axis=1)
+    return np.where(openLines.any(axis=1), cells, -1).astype(np.int8)
+
+def batchCumulativeTable(boards, weights):
+    # Works out the cumulative probability of picking each empty cell (in cell order) for every board.
+    #
+    # getProbabilityCell picks the first empty cell whose cumulative probability is higher than a random draw, drawing again
+    # if the draw is above the cumulative probability of the last empty cell.  This is the same as scaling the cumulative
+    # probabilities at each empty cell by the one at the last empty cell and drawing once.  Boards where none of the empty
+    # cells carry any weight pick an empty cell at random.
+    empty = boards == 0
+    cumulative = np.cumsum(weights, axis=1, dtype=np.float64)
+    limit = np.where(empty, cumulative, 0).max(axis=1)
+    noWeight = limit <= 0
+    cumulative[noWeight] = np.cumsum(empty[noWeight], axis=1)
+    limit[noWeight] = empty[noWeight].sum(axis=1)
+
+    # Move the value for each empty cell to the front, padding with a value no draw can reach
+    order = np.argsort(~empty, axis=1, kind="stable")
+    table = np.take_along_axis(np.where(empty, cumulative / np.maximum(limit, 1e-300)[:, None], 2.0), order, axis=1)
+    table[:, -1] = np.where(empty.all(axis=1), 2.0, table[:, -1])
+    return table
+
+def batchTableCells(keys, cumulativeTable, rng):
+    # Picks a cell for each board with one draw, using a table from batchCumulativeTable
+    choice = (cumulativeTable[keys] <= rng.random(len(keys))[:, None]).sum(axis=1)
+    return batchEmptyCells[keys, choice]
+
+def buildBatchTables():
+    # Works out everything the batch engine needs for every key, if it hasn't been done already
+    global batchPowersOfThree, lineMembership, allBoards, batchWinners, batchWinningCellTable, batchEmptyCells
+    global batchRandomTable, batchStaticTable, batchDynamicTable, batchStateIds, batchMovers
+    if (allBoards is not None): return
+
+    batchPowersOfThree = np.array(powersOfThree, dtype=np.int64)
+
+    # lineMembership[line][cell] is 1 if the cell is part of that winning combination.  Multiplying a batch of boards by
+    # this counts how many of a player's counters are in each winning combination
+    lineMembership = np.array([[1 if (line & cellBits[cell]) else 0 for cell in range(9)] for line in winningLines], dtype=np.float32)
+
+    # Every possible board, indexed by its key
+    boards = ((np.arange(3**9)[:, None] // batchPowersOfThree) % 3).astype(np.int8)
+
+    # The winner of each board (0 for no winner, 1 for O and 2 for X)
+    batchWinners = np.zeros(3**9, dtype=np.int8)
+    for piece in [1, 2]: batchWinners[(batchLineCounts(boards, piece) == 3).any(axis=1)] = piece
+
+    # The winning cell for each player, indexed by piece and then key
+    batchWinningCellTable = np.full((3, 3**9), -1, dtype=np.int8)
+    batchWinningCellTable[1] = batchWinningCells(boards, batchLineCounts(boards, 1), batchLineCounts(boards, 2))
+    batchWinningCellTable[2] = batchWinningCells(boards, batchLineCounts(boards, 2), batchLineCounts(boards, 1))
+
+    # The empty cells on each board, in cell order
+    batchEmptyCells = np.argsort(boards != 0, axis=1, kind="stable").astype(np.int8)
+
+    # The probability tables for the Random, StaticProbability and DynamicProbability strategies.  Each cell in the
+    # dynamic table is weighted by the number of winning combinations through it that don't contain an enemy counter for
+    # that player
+    batchRandomTable = batchCumulativeTable(boards, np.zeros(boards.shape))
+    batchStaticTable = batchCumulativeTable(boards, np.broadcast_to(lineMembership.sum(axis=0), boards.shape))
+    batchDynamicTable = [None,
+                         batchCumulativeTable(boards, (batchLineCounts(boards, 2) == 0).astype(np.float32) @ lineMembership),
+                         batchCumulativeTable(boards, (batchLineCounts(boards, 1) == 0).astype(np.float32) @ lineMembership)]
+
+    # The state id of each key for batch training, and the piece (1 for O and 2 for X) that makes each move of a game
+    numberStates()
+    batchStateIds = np.array(stateIds)
+    batchMovers = np.arange(9) % 2 + 1
+
+    allBoards = boards
+
+def batchWinBlockCells(keys, Me, Enemy, block, fallbackTable, rng):
+    # Picks a winning move for each board, then (if block is True) a blocking move, otherwise a cell from fallbackTable
+    cells = batchWinningCellTable[pieceValues[Me]][keys]
+    if (block == True): cells = np.where(cells == -1, batchWinningCellTable[pieceValues[Enemy]][keys], cells)
+
+    # Only the boards without a winning or blocking move need any more work
+    remaining = np.flatnonzero(cells == -1)
+    if (len(remaining) > 0): cells[remaining] = batchTableCells(keys[remaining], fallbackTable, rng)
+    return cells
+
+def playBatchGames(NumGames, cfg_Player1Strategy, cfg_Player2Strategy, rng, recordMoves=False):
+    # Plays a batch of games between two strategy objects (which must have been prepared with prepare_batch), returning the
+    # final boards and the winner of each (0 for no winner, 1 for O and 2 for X).  If recordMoves is True, the board key
+    # after each move of each game (-1 for moves that weren't played) is returned as well
+    if (cfg_Player1Strategy.geometry is not standardGeometry or cfg_Player2Strategy.geometry is not standardGeometry):
+        raise ValueError("Batch games can only be played on the 3x3 board")
+    buildBatchTables()
+
+    boards = np.zeros((NumGames, 9), dtype=np.int8)
+    keys = np.zeros(NumGames, dtype=np.int64)
+    moveKeys = np.full((NumGames, 9), -1, dtype=np.int64) if (recordMoves == True) else None
+
+    # The indices of the games that are still being played
+    active = np.arange(NumGames)
+
+    for moves in range(9):
+        if (moves % 2 == 0):
+            Me, Enemy, strategy = cfg_Player1, cfg_Player2, cfg_Player1Strategy
+        else:
+            Me, Enemy, strategy = cfg_Player2, cfg_Player1, cfg_Player2Strategy
+
+        cells = strategy.choose_batch_moves(keys[active], Me, Enemy, rng)
+        boards[active, cells] = pieceValues[Me]
+        keys[active] = keys[active] + pieceValues[Me] * batchPowersOfThree[cells]
+        if (recordMoves == True): moveKeys[active, moves] = keys[active]
+
+        # Any game with a winner is finished
+        active = active[batchWinners[keys[active]] == 0]
+        if (len(active) == 0): break
+
+    if (recordMoves == True): return boards, batchWinners[keys], moveKeys
+    return boards, batchWinners[keys]
+
+def loopBatchGames(players, TestingGames, seed=None, writer=None):
+    # Plays every pair of strategies against each other using the batch engine, passing the results to the ResultWriter
+    # (if one is given) as each pair finishes
+    for name in strategies: players[name].prepare_batch()
+    rng = np.random.default_rng(seed)
+
+    for strat1 in range(len(strategies)):
+        for strat2 in range(len(strategies)):
+            boards, winners = playBatchGames(TestingGames, players[strategies[strat1]], players[strategies[strat2]], rng)
+
+            player1 = int((winners == pieceValues[cfg_Player1]).sum())
+            player2 = int((winners == pieceValues[cfg_Player2]).sum())
+            draw = TestingGames - player1 - player2
+
+            record[strat1][strat2] = '%03d' % player1  + " / " + '%03d' % draw + " / " + '%03d' % player2
+            if (writer is not None): writer.update(strat1, strat2, player1, draw, player2, True)
+
+    if (writer is None): printRecord(record)
+    else: writer.finish()
+
+#############################################
+# Batch Training
+#############################################
+# The learning strategies can also be trained with the batch engine.  Each batch of games is played with the tables the
+# strategies had at the start of the batch, and then all of the updates from the batch are applied in one go, adding up
+# the changes for every board that was reached (numpy.add.at adds once for every time a board appears).
+#
+# By default the updates are the same as updateScores and updateStateValues.  ReinforcedLearning2 can instead learn with
+# TD(lambda) by giving a TDRule: each board's value moves towards the lambda-return from the point of view of the player
+# who moved into it, made up of the values of that player's later boards and the reward at the end of the game.  With a
+# trace of 0 this is TD(0), looking only at the player's next board, and with a trace of 1 only the final reward counts.
+#############################################
+
+class TDRule:
+    # The learning rate, discount, trace decay (lambda) and the rewards for a win, draw and loss used for TD learning.
+    # The rewards are on the same scale as the starting statevalues of 100, so boards that have never been seen aren't
+    # preferred over ones that have
+    __slots__ = ("rate", "discount", "trace", "rewards")
+
+    def __init__(self, rate=0.1, discount=0.9, trace=0.0, rewards=(200.0, 100.0, 0.0)):
+        if (not 0 < rate <= 1 or not 0 <= discount <= 1 or not 0 <= trace <= 1):
+            raise ValueError("The rate must be in (0, 1] and the discount and trace in [0, 1]")
+        self.rate = rate
+        self.discount = discount
+        self.trace = trace
+        self.rewards = rewards
+
+def batchTDReturns(values, played, winners, td):
+    # Works out the lambda-return for each move of each game, working back from the end of the game.  A player's next
+    # board is two moves later, and if they don't make another move the return is their reward for the result
+    win, draw, loss = td.rewards
+    results = winners[:, None]
+    rewards = np.where(results == batchMovers, win, np.where(results == 0, draw, loss))
+
+    # Two extra moves at the end that are never played, so every move has a next board
+    values = np.pad(values, ((0, 0), (0, 2)))
+    played = np.pad(played, ((0, 0), (0, 2)))
+    returns = np.zeros(values.shape)
+    for move in range(8, -1, -1):
+        following = td.discount * ((1 - td.trace) * values[:, move + 2] + td.trace * returns[:, move + 2])
+        returns[:, move] = np.where(played[:, move + 2], following, rewards[:, move])
+
+    return returns[:, :9]
+
+def batchUpdateScores(scores, boards, winners):
+    # The batch version of updateScores.  The cells used by each winner score 5 and, as in updateScores, every other cell
+    # loses 1 for each game (including drawn games).  A cell is only kept from reaching 0 at the end of the batch
+    won = ((boards == winners[:, None]) & (winners > 0)[:, None]).sum(axis=0)
+    scores = np.asarray(scores, dtype=np.float64) + 5 * won - (len(winners) - won)
+    scores[scores <= 0] = 1
+    return scores
+
+def batchUpdateStateValues(statevalues, moveKeys, winners, td=None):
+    # The batch version of updateStateValues, or TD learning if a TDRule is given.  moveKeys holds the board key after
+    # each move of each game, or -1 for moves that weren't played.
+    #
+    # With the fixed updates every game adds up as it would one at a time, but boards are only kept from going below 0
+    # at the end of the batch.  With TD learning each board moves by the learning rate times the average error over every
+    # time it was reached in the batch, as adding them all up would move boards reached in many games too far
+    buildBatchTables()
+    values = np.array(statevalues, dtype=np.float64)
+    played = moveKeys >= 0
+    states = batchStateIds[np.where(played, moveKeys, 0)]
+
+    if (td is None):
+        # The boards of the winner gain 11 and the boards of the loser lose 5
+        results = winners[:, None]
+        changes = np.where(results == batchMovers, 11, np.where(results == 0, 0, -5))
+        np.add.at(values, states[played], changes[played])
+        values[values < 0] = 1
+    else:
+        current = values[states]
+        errors = np.zeros(len(values))
+        np.add.at(errors, states[played], (batchTDReturns(current, played, winners, td) - current)[played])
+        values = values + td.rate * errors / np.maximum(np.bincount(states[played], minlength=len(values)), 1)
+
+    return values
+
+def batchTrainStrategies(players, TrainingGames, batchSize=10000, td=None, seed=None):
+    # The batch version of trainStrategies, training each of the learning strategies against DynamicProbability in
+    # batches of games
+    rng = np.random.default_rng(seed)
+    opponent = players["DynamicProbability"]
+    opponent.prepare_batch()
+
+    for name in trainingstrategies:
+        learner = players[name]
+        for start in range(0, TrainingGames, batchSize):
+            learner.prepare_batch()
+            boards, winners, moveKeys = playBatchGames(min(batchSize, TrainingGames - start), learner, opponent, rng, recordMoves=True)
+            learner.observe_batch(boards, winners, moveKeys, td)
+
+#############################################
+# Move Tables
+#############################################
+# WinRandom, BlockRandom, StaticProbability and DynamicProbability only look at the board, so everything they need for
+# every key is taken from the batch tables once and kept as lists, which are quicker than numpy arrays to look at one
+# board at a time.  Each move is then a lookup and at most one random draw.
+#
+# winningCells[Me][key] is the cell that completes a winning combination for Me (-1 if there isn't one), so the cell Me
+# needs to take to stop the enemy winning is winningCells[Enemy][key].  staticCells[key] and dynamicCells[Me][key] hold the
+# cumulative probability of picking each empty cell (in the same order as emptyCellLists).  They are built by buildMoveTables the
+# first time one of these strategies moves.
+#############################################
+
+def probabilityLists(table):
+    # Converts a table from batchCumulativeTable into a list for each key holding just the empty cells
+    counts = (allBoards == 0).sum(axis=1).tolist()
+    return [row[:count] for row, count in zip(table.tolist(), counts)]
+
+winningCells = None
+staticCells = None
+dynamicCells = None
+
+def buildMoveTables():
+    # Takes the move tables from the batch tables, if it hasn't been done already
+    global winningCells, staticCells, dynamicCells
+    if (dynamicCells is not None): return
+    buildBatchTables()
+    winningCells = {"O": batchWinningCellTable[1].tolist(), "X": batchWinningCellTable[2].tolist()}
+    staticCells = probabilityLists(batchStaticTable)
+    dynamicCells = {"O": probabilityLists(batchDynamicTable[1]), "X": probabilityLists(batchDynamicTable[2])}
+
+def getTableCell(board, probabilities):
+    # Picks an empty cell with a single draw from one of the probability tables
+    return emptyCellLists[board.counters["O"] | board.counters["X"]][bisect_right(probabilities[board.key], random())]
+
+#############################################
+# Monte Carlo Tree Search
+#############################################
+# MCTS plays out random games from the current board and keeps the results for every board it reaches, using them to
+# decide which moves to look at next (UCT) and, once its budget runs out, picking the move it looked at most.
+#
+# A board key identifies each node, so the visits and wins for every node are kept in two lists indexed by key (modulo
+# the table size of the geometry) rather than in an object per node, and a board reached by different orders of moves is
+# one node.  On the 3x3 board every key has its own entry; on larger boards two boards can share one, which only costs
+# a little accuracy.  The lists are allocated once and only the nodes touched in a game are cleared when the next game
+# starts, so the tree built for one move is reused for the rest of the game.  The wins for a node are from the point of
+# view of the player who moved into it.
+#
+# The moves of each search are made on the game's board and taken back at the end, and the moves from each board are
+# looked at one by one rather than building a list of them, so nothing is allocated for each move looked at.  Each
+# random game shuffles the empty cells as it goes and plays them in that order, so it never has to look for the empty
+# cells again, and only the lines through each new counter are checked for a win.
+#
+# The budget for each move is either a number of rollouts or a time limit in seconds.
+#############################################
+
+@registerStrategy
+class MCTSStrategy(Strategy):
+    # Not in strategies by default, as every move plays out a thousand games
+    name = "MCTS"
+
+    def __init__(self, geometry=None, rollouts=1000, timeLimit=None, exploration=1.4):
+        Strategy.__init__(self, geometry)
+        self.rollouts = rollouts
+        self.timeLimit = timeLimit
+        self.exploration = exploration
+        self.visits = [0] * self.geometry.tableSize
+        self.wins = [0.0] * self.geometry.tableSize
+        self.touched = []
+        self.game = None
+        self.totalRollouts = 0
+        self.totalTime = 0.0
+
+    def rolloutsPerSecond(self):
+        # The number of rollouts per second over every move picked so far
+        return self.totalRollouts / self.totalTime if (self.totalTime > 0) else 0.0
+
+    def reset(self):
+        # Clears the nodes from the last game
+        for node in self.touched:
+            self.visits[node] = 0
+            self.wins[node] = 0.0
+        self.touched = []
+
+    def choose_move(self, game):
+        if (game is not self.game):
+            self.reset()
+            self.game = game
+
+        board = game.board
+        start = perf_counter()
+        rollouts = 0
+        while True:
+            self.search(board, game.me)
+            rollouts = rollouts + 1
+            if (self.timeLimit is None):
+                if (rollouts >= self.rollouts): break
+            elif (rollouts % 16 == 0 and perf_counter() - start >= self.timeLimit): break
+
+        self.totalRollouts = self.totalRollouts + rollouts
+        self.totalTime = self.totalTime + perf_counter() - start
+
+        visits = self.visits
+        size = self.geometry.tableSize
+        zobrist = self.geometry.zobrist[game.me]
+        return max(self.geometry.emptyCells(board.counters["O"] | board.counters["X"]), key=lambda cell: visits[(board.key + zobrist[cell]) % size])
+
+    def search(self, board, Me):
+        # Walks down the tree from the board (with Me to move) until it reaches a board it hasn't seen, plays a random game
+        # from there and adds the result to every board on the way.  The board is put back as it was before returning
+        geometry = self.geometry
+        size = geometry.tableSize
+        visits = self.visits
+        wins = self.wins
+        counters = board.counters
+        noughts = counters["O"]
+        crosses = counters["X"]
+        key = board.key
+        path = [key % size]
+        mover = Me
+        winner = "No Winner"
+        while True:
+            cells = geometry.emptyCells(counters["O"] | counters["X"])
+            if (len(cells) == 0): break
+
+            zobrist = geometry.zobrist[mover]
+            unvisited = 0
+            for cell in cells:
+                if (visits[(key + zobrist[cell]) % size] == 0): unvisited = unvisited + 1
+
+            if (unvisited > 0):
+                # Pick one of the moves that have never been tried at random
+                skip = math.floor(random() * unvisited)
+                for cell in cells:
+                    if (visits[(key + zobrist[cell]) % size] == 0):
+                        if (skip == 0): break
+                        skip = skip - 1
+            else:
+                # Every move has been tried, so pick the one with the best upper confidence bound
+                scale = self.exploration * math.sqrt(math.log(max(visits[path[-1]], 1)))
+                bestBound = -math.inf
+                for candidate in cells:
+                    child = (key + zobrist[candidate]) % size
+                    bound = wins[child] / visits[child] + scale / math.sqrt(visits[child])
+                    if (bound > bestBound):
+                        bestBound = bound
+                        cell = candidate
+
+            key = key + zobrist[cell]
+            counters[mover] = counters[mover] | geometry.cellBits[cell]
+            path.append(key % size)
+            if (geometry.completesLine(counters[mover], cell) == True):
+                winner = mover
+                break
+
+            mover = opponents[mover]
+            if (unvisited > 0):
+                winner = self.rollout(counters, mover)
+                break
+
+        # Take back every move made in the search and the random game
+        counters["O"] = noughts
+        counters["X"] = crosses
+
+        # The player who moved into the first board of the path is the one who isn't about to move
+        moved = opponents[Me]
+        for node in path:
+            if (visits[node] == 0): self.touched.append(node)
+            visits[node] = visits[node] + 1
+            if (winner == moved): wins[node] = wins[node] + 1
+            elif (winner == "No Winner"): wins[node] = wins[node] + 0.5
+            moved = opponents[moved]
+
+    def rollout(self, counters, mover):
+        # Plays random moves (with mover to move first) to the end of the game, returning the winner
+        geometry = self.geometry
+        cells = geometry.emptyCells(counters["O"] | counters["X"])[:]
+        for move in range(len(cells)):
+            # Swap a random cell from the ones left into this position and play it
+            swap = move + math.floor(random() * (len(cells) - move))
+            cell = cells[swap]
+            cells[swap] = cells[move]
+            counters[mover] = counters[mover] | geometry.cellBits[cell]
+            if (geometry.completesLine(counters[mover], cell) == True): return mover
+            mover = opponents[mover]
+
+        return "No Winner"
+
+#############################################
+# Saving and Loading Learned Tables
+#############################################
+# The scores (ReinforcedLearning1) and statevalues (ReinforcedLearning2) can be saved to a model file so that they don't
+# have to be learned again every run.  The file is a small header followed by the scores and then the statevalues, each
+# as a little-endian 64-bit float (so values learned with TD learning can be saved):
+#
+#   magic (4 bytes) | version | number of scores | number of statevalues | scores... | statevalues...
+#
+# The tournament workers map the file into memory rather than reading it, so processes that map the same file share one
+# copy of it.  loadModel copies the tables into lists for the players in this process, as they are tiny.
+#
+# The layouts are given as numpy dtype specs rather than dtypes, so numpy isn't loaded until a file is read or written.
+#############################################
+
+modelMagic = b"TTTM"
+modelVersion = 2
+modelHeader = [("magic", "S4"), ("version", "<u4"), ("numScores", "<u4"), ("numStates", "<u4")]
+modelValueType = "<f8"
+
+def saveModel(path, players):
+    # Writes the scores and statevalues learned by the players to a model file.  The tables may be mapped from the file
+    # being replaced, so they are copied out first and the new file is written alongside it and then moved over it
+    scores = list(players["ReinforcedLearning1"].scores)
+    statevalues = list(players["ReinforcedLearning2"].statevalues)
+    header = np.zeros(1, dtype=modelHeader)
+    header[0] = (modelMagic, modelVersion, len(scores), len(statevalues))
+    with open(str(path) + ".tmp", "wb") as modelFile:
+        modelFile.write(header.tobytes())
+        modelFile.write(np.asarray(scores, dtype=modelValueType).tobytes())
+        modelFile.write(np.asarray(statevalues, dtype=modelValueType).tobytes())
+    os.replace(str(path) + ".tmp", path)
+
+def mapModel(path, mode="r"):
+    # Maps the scores and statevalues from a model file, checking that it was written for this version of the tables.
+    # The mode is passed to numpy.memmap: "r" is read-only and "c" allows changes that are never written back to the file
+    numberStates()
+    header = np.fromfile(path, dtype=modelHeader, count=1)
+    if (len(header) != 1 or header[0]["magic"] != modelMagic):
+        raise ValueError(str(path) + " is not a model file")
+    if (header[0]["version"] != modelVersion):
+        raise ValueError(str(path) + " is model version " + str(header[0]["version"]) + ", expected " + str(modelVersion))
+    if (header[0]["numScores"] != 9 or header[0]["numStates"] != numStates):
+        raise ValueError(str(path) + " has tables of the wrong size")
+
+    tables = np.memmap(path, dtype=modelValueType, mode=mode, offset=np.dtype(modelHeader).itemsize, shape=(9 + numStates,))
+    return tables[:9], tables[9:]
+
+def loadModel(path, players):
+    # Uses the tables in a model file for the learning players.  The players look at one value at a time, which is much
+    # quicker in a list than in the mapped array, so the tables are copied (any further learning isn't written back)
+    scores, statevalues = mapModel(path)
+    players["ReinforcedLearning1"].scores = scores.tolist()
+    players["ReinforcedLearning2"].statevalues = statevalues.tolist()
+
+#############################################
+# Tablebase
+#############################################
+# Every board that can be reached in a 3x3 game can be solved ahead of time and written to a tablebase file, which is then
+# both the opening book and the endgame tablebase.  For each canonical board (see Symmetry) the file holds the result for
+# the player about to move (1 for a win, 0 for a draw and -1 for a loss) and the number of moves until the game ends with
+# both players playing perfectly, where the winner wins as soon as they can and the loser holds out for as long as they
+# can.  Finished boards have a distance of 0, with the player to move having lost (or drawn if the board is full).
+#
+#   magic (4 bytes) | version | number of boards | (canonical key, result, distance)...
+#
+# Each board takes 4 bytes, so the whole file is about 3KB.  Loading the file fills in every rotation and reflection of
+# each board and works out the best moves from each one, so a move or a result is a single lookup by board key.  The
+# Tablebase strategy plays from it, and seedStateValues uses it to start ReinforcedLearning2 from the real value of each
+# board rather than a flat 100.
+#############################################
+
+tablebaseMagic = b"TTTB"
+tablebaseVersion = 1
+tablebaseHeader = [("magic", "S4"), ("version", "<u4"), ("numBoards", "<u4")]
+tablebaseRecord = [("key", "<u2"), ("result", "i1"), ("distance", "u1")]
+tablebase = None
+
+class Tablebase:
+    # The result and distance for the player about to move on every board, indexed by key, along with the best moves
+    # from each unfinished board.  Boards that can't be reached in a game have a distance of -1
+    __slots__ = ("results", "distances", "bestCells")
+
+    def __init__(self, boards):
+        # boards holds the (result, distance) of each canonical key
+        self.results = [0] * 3**9
+        self.distances = [-1] * 3**9
+        for canonical, (result, distance) in boards.items():
+            for key in symmetricKeys(canonical):
+                self.results[key] = result
+                self.distances[key] = distance
+
+        # The best moves keep the best result for the player to move, winning as quickly or losing as slowly as possible.
+        # The board after each move is scored from the opponent's side, so it is negated
+        self.bestCells = [None] * 3**9
+        for key in range(3**9):
+            if (self.distances[key] <= 0): continue
+            noughts, crosses = keyCounters(key)
+            occupied = noughts | crosses
+            piece = pieceValues[cfg_Player1] if (counterCounts[occupied] % 2 == 0) else pieceValues[cfg_Player2]
+            bestScore = -1000
+            for cell in emptyCellLists[occupied]:
+                after = key + piece * powersOfThree[cell]
+                score = -self.results[after] * (100 - self.distances[after])
+                if (score > bestScore):
+                    bestScore = score
+                    self.bestCells[key] = [cell]
+                elif (score == bestScore): self.bestCells[key].append(cell)
+
+def solveTablebaseBoards(board, Me, Enemy, boards):
+    # Adds the result and distance of the board (with Me to move) and every board that can follow it to boards, once for
+    # each canonical board
+    canonical = canonicalKey(board.key)
+    if (canonical in boards): return
+
+    occupied = board.counters["O"] | board.counters["X"]
+    moves = counterCounts[occupied]
+    if (victoryTable[board.counters[Enemy]] == True):
+        boards[canonical] = (-1, 0)
+        return
+    if (occupied == 0b111111111):
+        boards[canonical] = (0, 0)
+        return
+
+    # The solver's value says how many counters are on the board when the game is won, and a drawn game fills the board
+    value = negamax(board, Me, Enemy, -10, 10)
+    if (value > 0): boards[canonical] = (1, 10 - value - moves)
+    elif (value < 0): boards[canonical] = (-1, 10 + value - moves)
+    else: boards[canonical] = (0, 9 - moves)
+
+    for cell in range(9):
+        if (occupied & cellBits[cell] == 0):
+            placeCounter(board, cell, Me)
+            solveTablebaseBoards(board, Enemy, Me, boards)
+            removeCounter(board, cell, Me)
+
+def generateTablebase():
+    # Solves every board that can be reached in a game, returning the (result, distance) of each canonical key
+    global transpositionTable
+    if (transpositionTable is None): transpositionTable = [None for i in range(3**9)]
+    boards = {}
+    solveTablebaseBoards(Board(), cfg_Player1, cfg_Player2, boards)
+    return boards
+
+def writeTablebase(path, boards=None):
+    # Writes a tablebase file, solving the game first if no boards are given
+    if (boards is None): boards = generateTablebase()
+    header = np.zeros(1, dtype=tablebaseHeader)
+    header[0] = (tablebaseMagic, tablebaseVersion, len(boards))
+    records = np.array([(key, result, distance) for key, (result, distance) in sorted(boards.items())], dtype=tablebaseRecord)
+    with open(path, "wb") as tablebaseFile:
+        tablebaseFile.write(header.tobytes())
+        tablebaseFile.write(records.tobytes())
+
+def readTablebase(path):
+    # Reads a tablebase file
+    header = np.fromfile(path, dtype=tablebaseHeader, count=1)
+    if (len(header) != 1 or header[0]["magic"] != tablebaseMagic):
+        raise ValueError(str(path) + " is not a tablebase file")
+    if (header[0]["version"] != tablebaseVersion):
+        raise ValueError(str(path) + " is tablebase version " + str(header[0]["version"]) + ", expected " + str(tablebaseVersion))
+
+    records = np.fromfile(path, dtype=tablebaseRecord, count=int(header[0]["numBoards"]), offset=np.dtype(tablebaseHeader).itemsize)
+    if (len(records) != header[0]["numBoards"]): raise ValueError(str(path) + " is too short")
+    return Tablebase({key: (result, distance) for key, result, distance in records.tolist()})
+
+def getTablebase():
+    # Returns the tablebase, reading it from cfg_TablebaseFile if there is one or solving the game if not
+    global tablebase
+    if (tablebase is None):
+        if (cfg_TablebaseFile is not None and os.path.exists(cfg_TablebaseFile)): tablebase = readTablebase(cfg_TablebaseFile)
+        else: tablebase = Tablebase(generateTablebase())
+    return tablebase
+
+def seedStateValues(statevalues, tablebase, rewards=(200.0, 100.0, 0.0)):
+    # Starts ReinforcedLearning2's statevalues from the tablebase.  Each board is worth the reward for the result of the
+    # player who moved into it (the rewards for a win, draw and loss are on the same scale as TDRule's), a little more
+    # for quicker wins and slower losses
+    numberStates()
+    win, draw, loss = rewards
+    for key in range(3**9):
+        if (stateIds[key] < 0 or tablebase.distances[key] < 0): continue
+        result = -tablebase.results[key]
+        if (result == 1): statevalues[stateIds[key]] = win - tablebase.distances[key]
+        elif (result == 0): statevalues[stateIds[key]] = draw
+        else: statevalues[stateIds[key]] = loss + tablebase.distances[key]
+
+@registerStrategy
+class TablebaseStrategy(Strategy):
+    # Plays one of the best moves in the tablebase, which wins as quickly as possible.  Not in strategies by default, as
+    # it plays the same as Perfect apart from that
+    name = "Tablebase"
+
+    def __init__(self, geometry=None):
+        Strategy.__init__(self, geometry)
+        if (self.geometry is not standardGeometry): raise ValueError("The Tablebase strategy can only play on the 3x3 board")
+        self.tablebase = getTablebase()
+
+    def choose_move(self, game):
+        cells = self.tablebase.bestCells[game.board.key]
+        return cells[math.floor(random() * len(cells))]
+
+    def prepare_batch(self):
+        buildBatchTables()
+        bestCells = np.zeros(allBoards.shape)
+        for key in range(3**9):
+            if (self.tablebase.bestCells[key] is not None): bestCells[key, self.tablebase.bestCells[key]] = 1
+        self.batchTable = batchCumulativeTable(allBoards, bestCells)
+
+    def choose_batch_moves(self, keys, Me, Enemy, rng):
+        return batchTableCells(keys, self.batchTable, rng)
+
+#############################################
+# Game Log
+#############################################
+# Every game played can be written to a log file so it can be looked at or learned from later.  The file is a header
+# with the names of the strategies, followed by one little-endian 64-bit record per game:
+#
+#   magic (4 bytes) | version | number of strategies | names (32 bytes each)... | records...
+#
+#   bits 0-3   player 1 strategy (index into the names)     bits 8-11  number of moves
+#   bits 4-7   player 2 strategy                            bits 12-15 winner (0 for no winner, 1 for O and 2 for X)
+#   bits 16-51 the cell of each move, 4 bits per move in the order they were played (unused moves are 15)
+#
+# Games are buffered and packed into records with numpy every bufferSize games, then written in one go, so logging adds
+# very little to each game.
+# Only games played in this process are logged.  The tournament and training workers drop the log they inherit, and
+# nothing is left in the file's buffer when they start, so they can't write to it.
+#############################################
+
+gameLogMagic = b"TTTL"
+gameLogVersion = 1
+gameLogHeader = [("magic", "S4"), ("version", "<u4"), ("numStrategies", "<u4")]
+gameLogNameType = "S32"
+gameLogRecordType = "<u8"
+gameLogWinners = ["No Winner", "O", "X"]
+gameLogUnusedMoves = [15, 15, 15, 15, 15, 15, 15, 15, 15]
+gameLogCellShifts = [move * 4 + 16 for move in range(9)]
+gameLog = None
+
+class GameLog:
+    # Writes game records to a log file, using the names given to number the strategies
+    def __init__(self, path, names, bufferSize=65536):
+        if (len(names) > 16): raise ValueError("A game log can only hold 16 strategies")
+        self.strategyIds = {name: i for i, name in enumerate(names)}
+        self.bufferSize = bufferSize
+        self.headers = []
+        self.cells = bytearray()
+        self.file = open(path, "wb")
+
+        header = np.zeros(1, dtype=gameLogHeader)
+        header[0] = (gameLogMagic, gameLogVersion, len(names))
+        self.file.write(header.tobytes())
+        self.file.write(np.array(names, dtype=gameLogNameType).tobytes())
+        self.file.flush()
+
+    def write(self, game):
+        # Adds a record for a finished game.  The cells are only packed into the records when they are written
+        if (game.board.geometry is not standardGeometry): raise ValueError("Only 3x3 games can be logged")
+        cells = game.cells
+        self.headers.append(self.strategyIds[game.strategies[0].name]
+                            | (self.strategyIds[game.strategies[1].name] << 4)
+                            | (len(cells) << 8)
+                            | (pieceValues.get(game.winner, 0) << 12))
+        self.cells += bytes(cells + gameLogUnusedMoves[len(cells):])
+        if (len(self.headers) >= self.bufferSize): self.flush()
+
+    def flush(self):
+        # Packs the buffered games into records and writes them to the file
+        if (len(self.headers) > 0):
+            cells = np.frombuffer(self.cells, dtype=np.uint8).reshape(-1, 9).astype(gameLogRecordType)
+            shifts = np.array(gameLogCellShifts, dtype=gameLogRecordType)
+            records = np.array(self.headers, dtype=gameLogRecordType) | ((cells << shifts).sum(axis=1, dtype=gameLogRecordType))
+            self.file.write(records.tobytes())
+            self.file.flush()
+            self.headers = []
+            self.cells = bytearray()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def openGameLog(path, names=None):
+    # Starts logging every game played to a new log file
+    global gameLog
+    closeGameLog()
+    gameLog = GameLog(path, strategies if (names is None) else names)
+
+def closeGameLog():
+    # Stops logging games, writing any that are still buffered
+    global gameLog
+    if (gameLog is not None): gameLog.close()
+    gameLog = None
+
+def readGameLogRecords(path, chunkSize=65536):
+    # Reads a log file a chunk at a time, yielding the strategy names and then arrays of (player 1 strategy, player 2
+    # strategy, number of moves, winner, cells) for each chunk.  Only one chunk is held in memory at a time
+    header = np.fromfile(path, dtype=gameLogHeader, count=1)
+    if (len(header) != 1 or header[0]["magic"] != gameLogMagic):
+        raise ValueError(str(path) + " is not a game log")
+    if (header[0]["version"] != gameLogVersion):
+        raise ValueError(str(path) + " is game log version " + str(header[0]["version"]) + ", expected " + str(gameLogVersion))
+
+    numStrategies = int(header[0]["numStrategies"])
+    headerSize = np.dtype(gameLogHeader).itemsize
+    names = [name.decode() for name in np.fromfile(path, dtype=gameLogNameType, count=numStrategies, offset=headerSize)]
+    yield names
+
+    offset = headerSize + numStrategies * np.dtype(gameLogNameType).itemsize
+    shifts = np.array(gameLogCellShifts, dtype=gameLogRecordType)
+    while True:
+        records = np.fromfile(path, dtype=gameLogRecordType, count=chunkSize, offset=offset)
+        if (len(records) == 0): return
+        offset = offset + records.nbytes
+
+        yield (records & 0xF, (records >> 4) & 0xF, (records >> 8) & 0xF, (records >> 12) & 0xF,
+               ((records[:, None] >> shifts) & 0xF).astype(np.int8))
+
+def readGameLog(path, chunkSize=65536):
+    # Yields (player 1 strategy, player 2 strategy, winner, cells) for each game in a log file, in the order they were played
+    records = readGameLogRecords(path, chunkSize)
+    names = next(records)
+    for player1, player2, moves, winners, cells in records:
+        for game in range(len(player1)):
+            yield (names[player1[game]], names[player2[game]], gameLogWinners[winners[game]], cells[game, :moves[game]].tolist())
+
+def summariseGameLog(path):
+    # Counts the wins for player 1, draws and wins for player 2 for each pair of strategies in a log file, without replaying
+    # the games
+    records = readGameLogRecords(path)
+    names = next(records)
+    counts = np.zeros((len(names), len(names), 3), dtype=np.int64)
+    for player1, player2, moves, winners, cells in records:
+        # Results are counted as player 1 wins, draws and player 2 wins, so swap the draws (0) and player 1 wins (1)
+        np.add.at(counts, (player1.astype(np.intp), player2.astype(np.intp), np.array([1, 0, 2])[winners.astype(np.intp)]), 1)
+
+    return {(names[x], names[y]): counts[x, y].tolist() for x in range(len(names)) for y in range(len(names)) if (counts[x, y].sum() > 0)}
+
+def trainFromGameLog(path, players, learners=None):
+    # Replays every game in a log file and lets the learning strategies learn from each of them, as if they had played them
+    learners = [players[name] for name in (trainingstrategies if (learners is None) else learners)]
+    for player1, player2, winner, cells in readGameLog(path):
+        game = Game(learners[0], learners[0])
+        game.replay(cells)
+        for learner in learners: learner.observe_result(game)
+
+#############################################
+# Parallel Tournament
+#############################################
+# Every pair of strategies (and every chunk of games within a pair) can be played independently, so we can spread them
+# over several processes.  The learning strategies are trained once up front and every chunk of games starts from a copy
+# of those trained tables with its own random seed, taken from the master seed, the pair of strategies and the chunk.
+# The results therefore only depend on the master seed and chunk size, not on how many workers play them or in which order.
+#
+# If the trained tables are saved to a model file, each worker maps that file instead of being sent its own copy.
+#############################################
+
+def initTournamentWorker(names, trainedScores, trainedStateValues, modelFile, profile=False):
+    # Each worker process plays the same strategies as the main process and keeps the trained tables, either as its own
+    # copy or mapped read-only from the model file.  Workers don't log their games, so the log they inherit is dropped,
+    # and they start with an empty profile so the stats the main process had already collected aren't sent back to it
+    global baseScores, baseStateValues, gameLog, profileStats
+    gameLog = None
+    useStrategies(names)
+    if (profile == True):
+        enableProfiling()
+        profileStats = {}
+    else: disableProfiling()
+    if (modelFile is not None):
+        baseScores, baseStateValues = mapModel(modelFile)
+    else:
+        baseScores = trainedScores
+        baseStateValues = trainedStateValues
+
+def playTournamentChunk(strat1, strat2, chunk, NumGames, masterSeed, freeze=False):
+    # Plays one chunk of games for a pair of strategies, returning the number of wins for each player, the number of draws
+    # and the profile stats for the chunk (None if profiling is disabled)
+    seedRandom(str(masterSeed) + "/" + strategies[strat1] + "/" + strategies[strat2] + "/" + str(chunk))
+
+    # Start from new players with the trained tables so the chunk doesn't depend on any games this worker has already played
+    players = makePlayers(strategies)
+    players["ReinforcedLearning1"].scores = np.asarray(baseScores).tolist()
+    players["ReinforcedLearning2"].statevalues = np.asarray(baseStateValues).tolist()
+
+    player1 = 0
+    player2 = 0
+    draw = 0
+    for _1 in range(NumGames):
+        winner = playGame(players[strategies[strat1]], players[strategies[strat2]], not freeze)
+
+        if (winner == cfg_Player1):
+            player1 = player1 + 1
+        elif (winner == cfg_Player2):
+            player2 = player2 + 1
+        else: draw = draw + 1
+
+    return strat1, strat2, player1, draw, player2, takeProfileStats()
+
+def runTournament(players, TrainingGames, TestingGames, masterSeed, workers=None, chunkSize=250, modelFile=None, freeze=False, writer=None):
+    # Plays every pair of strategies against each other, spreading the games over a pool of worker processes.
+    # If a model file is given, the trained tables are saved to it and shared with the workers through it.  If freeze is
+    # True the testing games don't change the tables.  If a ResultWriter is given, the running totals for a pair are
+    # passed to it as each chunk finishes
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    seedRandom(masterSeed)
+    if (masterSeed is None): masterSeed = math.floor(random() * 2**32)
+    trainStrategies(players, TrainingGames)
+
+    if (modelFile is not None):
+        saveModel(modelFile, players)
+        workerTables = (list(strategies), None, None, modelFile, profileStats is not None)
+    else:
+        workerTables = (list(strategies), players["ReinforcedLearning1"].scores, players["ReinforcedLearning2"].statevalues, None, profileStats is not None)
+
+    results = [[[0, 0, 0] for x in range(len(strategies))] for y in range(len(strategies))]
+    chunksLeft = [[len(range(0, TestingGames, chunkSize)) for x in range(len(strategies))] for y in range(len(strategies))]
+    with ProcessPoolExecutor(max_workers=workers, initializer=initTournamentWorker, initargs=workerTables) as pool:
+        chunks = []
+        for strat1 in range(len(strategies)):
+            for strat2 in range(len(strategies)):
+                for chunk in range(0, TestingGames, chunkSize):
+                    chunks.append(pool.submit(playTournamentChunk, strat1, strat2, chunk // chunkSize, min(chunkSize, TestingGames - chunk), masterSeed, freeze))
+
+        for future in as_completed(chunks):
+            strat1, strat2, player1, draw, player2, stats = future.result()
+            if (profileStats is not None): mergeProfileStats(profileStats, stats)
+            results[strat1][strat2][0] = results[strat1][strat2][0] + player1
+            results[strat1][strat2][1] = results[strat1][strat2][1] + draw
+            results[strat1][strat2][2] = results[strat1][strat2][2] + player2
+            chunksLeft[strat1][strat2] = chunksLeft[strat1][strat2] - 1
+            if (writer is not None): writer.update(strat1, strat2, *results[strat1][strat2], chunksLeft[strat1][strat2] == 0)
+
+    for strat1 in range(len(strategies)):
+        for strat2 in range(len(strategies)):
+            player1, draw, player2 = results[strat1][strat2]
+            record[strat1][strat2] = '%03d' % player1  + " / " + '%03d' % draw + " / " + '%03d' % player2
+
+    if (writer is None): printRecord(record)
+    else: writer.finish()
+
+#############################################
+# Parallel Training
+#############################################
+# Training can be spread over several processes too.  Training is split into rounds, and in each round every worker
+# starts from a copy of the current tables, plays its share of the training games for each learning strategy and sends
+# back how much its tables changed along with how many times it reached each board.  The changes from every worker are
+# then merged into the tables before the next round starts, so the workers learn from each other every round.
+#
+# Merging with "sum" adds up every worker's changes, which is the same as playing all of the games in one process with
+# the fixed updates, apart from games in the same round not seeing each other's changes.  "average" weights each
+# worker's change to a board by how many times that worker reached it, which suits updates that move a value towards a
+# target (as TD learning does) rather than adding to it.
+#
+# The results only depend on the master seed, the number of workers and the number of rounds.
+#############################################
+
+def initTrainingWorker():
+    # Sets up a training worker process, which doesn't log its games
+    global gameLog
+    gameLog = None
+
+def playTrainingChunk(scores, statevalues, NumGames, opponent, seed):
+    # Plays NumGames for each learning strategy from the given tables, returning the change in the scores, the change in
+    # the statevalues and the number of times each board was reached by ReinforcedLearning2's games
+    seedRandom(seed)
+    players = makePlayers(strategies)
+    players["ReinforcedLearning1"].scores = list(scores)
+    players["ReinforcedLearning2"].statevalues = list(statevalues)
+    buildBatchTables()
+    visits = np.zeros(numStates, dtype=np.int64)
+
+    for name in trainingstrategies:
+        learner = players[name]
+        enemy = learner if (opponent is None) else players[opponent]
+        for _1 in range(NumGames):
+            game = Game(learner, enemy)
+            game.play()
+            if (name == "ReinforcedLearning2"): np.add.at(visits, batchStateIds[game.moveList], 1)
+
+    return (np.subtract(players["ReinforcedLearning1"].scores, scores),
+            np.subtract(players["ReinforcedLearning2"].statevalues, statevalues),
+            visits)
+
+def mergeTrainingChunks(scores, statevalues, chunks, merge):
+    # Applies the changes from each worker to the tables, returning the new tables
+    scoreChanges, valueChanges, visits = [np.array(changes) for changes in zip(*chunks)]
+    if (merge == "sum"):
+        scores = scores + scoreChanges.sum(axis=0)
+        statevalues = statevalues + valueChanges.sum(axis=0)
+    elif (merge == "average"):
+        scores = scores + scoreChanges.mean(axis=0)
+        statevalues = statevalues + (valueChanges * visits).sum(axis=0) / np.maximum(visits.sum(axis=0), 1)
+    else:
+        raise ValueError("Unknown merge: " + str(merge))
+
+    # The same limits as updateScores and updateStateValues
+    scores[scores <= 0] = 1
+    statevalues[statevalues < 0] = 1
+    return scores, statevalues
+
+def runParallelTraining(players, TrainingGames, masterSeed, workers=None, rounds=10, opponent="DynamicProbability", merge="sum"):
+    # Trains each learning strategy for TrainingGames over a pool of worker processes, against the opponent or against
+    # itself if opponent is None
+    from concurrent.futures import ProcessPoolExecutor
+    seedRandom(masterSeed)
+    if (masterSeed is None): masterSeed = math.floor(random() * 2**32)
+    if (workers is None): workers = os.cpu_count()
+
+    scores = np.array(players["ReinforcedLearning1"].scores, dtype=np.float64)
+    statevalues = np.array(players["ReinforcedLearning2"].statevalues, dtype=np.float64)
+    with ProcessPoolExecutor(max_workers=workers, initializer=initTrainingWorker) as pool:
+        for trainingRound in range(rounds):
+            # Split this round's games as evenly as possible over the workers
+            roundGames = TrainingGames * (trainingRound + 1) // rounds - TrainingGames * trainingRound // rounds
+            chunks = [pool.submit(playTrainingChunk, scores.tolist(), statevalues.tolist(),
+                                  roundGames * (worker + 1) // workers - roundGames * worker // workers, opponent,
+                                  str(masterSeed) + "/train/" + str(trainingRound) + "/" + str(worker))
+                      for worker in range(workers)]
+            scores, statevalues = mergeTrainingChunks(scores, statevalues, [chunk.result() for chunk in chunks], merge)
+
+    players["ReinforcedLearning1"].scores[:] = scores.tolist()
+    players["ReinforcedLearning2"].statevalues[:] = statevalues.tolist()
+
+#############################################
+# Reporting Results
+#############################################
+# Long tournaments report as they go rather than only printing the table at the end.  Each pair of strategies is written
+# out as soon as all of its games have been played: as a row of CSV, as one JSON object per line, or (for the table
+# format) kept until the end and printed with printRecord.  While the games are being played a progress line with the
+# running totals is written to the progress stream (stderr) every few seconds, so the results stay clean for scripts.
+#############################################
+
+class ResultWriter:
+    # Writes the results of a tournament in the given format as each pair of strategies finishes
+    formats = ["table", "csv", "json"]
+
+    def __init__(self, format="table", out=None, progress=None, interval=5.0):
+        if (format not in self.formats): raise ValueError("Unknown output format: " + str(format))
+        self.format = format
+        self.out = sys.stdout if (out is None) else out
+        self.progress = progress
+        self.interval = interval
+        self.start = perf_counter()
+        self.lastProgress = self.start
+        self.finishedPairs = 0
+        self.games = 0
+        self.csv = None
+
+    def csvWriter(self, columns):
+        # Returns the CSV writer, writing the header row the first time
+        if (self.csv is None):
+            import csv
+            self.csv = csv.writer(self.out, lineterminator="\n")
+            self.csv.writerow(columns)
+        return self.csv
+
+    def status(self, message):
+        # Writes a line to the progress stream, if there is one
+        if (self.progress is not None):
+            print("[%8.1fs] %s" % (perf_counter() - self.start, message), file=self.progress, flush=True)
+
+    def update(self, strat1, strat2, player1, draw, player2, finished=False):
+        # Takes the results so far for a pair of strategies, writing them out if all of the pair's games have been played
+        now = perf_counter()
+        if (finished == True):
+            self.finishedPairs = self.finishedPairs + 1
+            self.games = self.games + player1 + draw + player2
+            if (self.format == "csv"):
+                self.csvWriter(["player1", "player2", "player1_wins", "draws", "player2_wins", "games"]).writerow(
+                    [strategies[strat1], strategies[strat2], player1, draw, player2, player1 + draw + player2])
+                self.out.flush()
+            elif (self.format == "json"):
+                import json
+                print(json.dumps({"player1": strategies[strat1], "player2": strategies[strat2], "player1_wins": player1,
+                                  "draws": draw, "player2_wins": player2, "games": player1 + draw + player2}), file=self.out, flush=True)
+
+        if (finished == True or now - self.lastProgress >= self.interval):
+            self.lastProgress = now
+            self.status("%d/%d %s v %s: %d / %d / %d%s" % (self.finishedPairs, len(strategies)**2, strategies[strat1], strategies[strat2],
+                                                          player1, draw, player2, "" if (finished == True) else " so far"))
+
+    def finish(self):
+        # Called once every pair has been played
+        elapsed = perf_counter() - self.start
+        self.status("Played %d testing games in %.1fs (%.0f games/sec)" % (self.games, elapsed, self.games / max(elapsed, 1e-9)))
+        if (self.format == "table"): printRecord(record)
+
+    def updateRatings(self, ratings, finished=False):
+        # Takes the ratings so far, writing out the ranking once the rating has finished
+        now = perf_counter()
+        if (finished == False and now - self.lastProgress < self.interval): return
+        self.lastProgress = now
+        values, halfWidths = ratings.ratings()
+        if (finished == False):
+            self.status("%d games, widest interval %.0f" % (ratings.games(), 2 * halfWidths.max()))
+            return
+
+        elapsed = now - self.start
+        self.status("Rated %d strategies in %d games in %.1fs" % (len(ratings.names), ratings.games(), elapsed))
+        ranking = [(ratings.names[strat], values[strat], halfWidths[strat], ratings.strategyGames(strat)) for strat in np.argsort(-values)]
+        if (self.format == "table"):
+            from prettytable import PrettyTable
+            t = PrettyTable(["Rank", "Strategy", "Rating", "95% interval", "Games"])
+            for rank, (name, value, halfWidth, games) in enumerate(ranking):
+                t.add_row([rank + 1, name, "%.0f" % value, "%.0f to %.0f" % (value - halfWidth, value + halfWidth), games])
+            print(t, file=self.out)
+            print("Going first is worth %.0f, total games %d" % (ratings.firstMove(), ratings.games()), file=self.out, flush=True)
+        elif (self.format == "csv"):
+            writer = self.csvWriter(["rank", "strategy", "rating", "low", "high", "games"])
+            for rank, (name, value, halfWidth, games) in enumerate(ranking):
+                writer.writerow([rank + 1, name, round(value, 1), round(value - halfWidth, 1), round(value + halfWidth, 1), games])
+            self.out.flush()
+        else:
+            import json
+            print(json.dumps({"ratings": [{"strategy": name, "rating": round(value, 1), "low": round(value - halfWidth, 1),
+                                           "high": round(value + halfWidth, 1), "games": games} for name, value, halfWidth, games in ranking],
+                              "first_move": round(ratings.firstMove(), 1), "games": ratings.games(),
+                              "pairs": [{"player1": ratings.names[strat1], "player2": ratings.names[strat2], "games": int(ratings.results[strat1, strat2].sum())}
+                                        for strat1, strat2 in ratings.pairs]}), file=self.out, flush=True)
+
+#############################################
+# Ratings
+#############################################
+# Rather than playing the same number of games between every pair of strategies, rateStrategies keeps an Elo rating for
+# each strategy and only plays more games where they are needed.  The ratings are fitted to all of the games played so
+# far (with a draw counted as half a win), along with how much going first is worth, so the expected score of player 1 is
+#
+#   1 / (1 + 10^((rating2 - rating1 - firstMove) / 400))
+#
+# The fit (Newton's method on the log likelihood) also gives the covariance of the ratings and so a 95% confidence
+# interval for each one.  A weak prior on the ratings keeps them finite for strategies that never lose.
+#
+# After a first batch of games for every pair, each batch goes to the pair that would narrow the widest interval the
+# most.  A batch of n games between a pair with expected score p tells us about as much as n * p * (1 - p), which is
+# small for lopsided pairs whose result is already clear, and the covariance says how much that narrows each interval.
+# Rating stops once every interval is narrower than the target (or the games run out).
+#
+# The ratings assume each strategy plays the same throughout, so the rating games never change what they have learned.
+#############################################
+
+eloScale = 400 / math.log(10)
+ratingPrior = 1000.0 # Standard deviation of the prior on each rating
+
+class Ratings:
+    # The results between each pair of strategies (indices into names, the first one playing first) and the ratings
+    # fitted to them.  The fitted parameters are kept in natural log odds: a rating for each strategy and then firstMove
+    def __init__(self, names, prior=ratingPrior):
+        self.names = list(names)
+        size = len(self.names)
+        self.results = np.zeros((size, size, 3), dtype=np.int64) # Player 1 wins, draws and player 2 wins
+        self.prior = prior / eloScale
+        self.parameters = np.zeros(size + 1)
+        self.covariance = np.eye(size + 1) * self.prior**2
+
+        # Each pair's row of the fit is +1 for player 1's rating, -1 for player 2's and 1 for going first
+        self.pairs = [(strat1, strat2) for strat1 in range(size) for strat2 in range(size)]
+        self.design = np.zeros((len(self.pairs), size + 1))
+        for row, (strat1, strat2) in enumerate(self.pairs):
+            self.design[row, strat1] = self.design[row, strat1] + 1
+            self.design[row, strat2] = self.design[row, strat2] - 1
+            self.design[row, size] = 1
+
+        # Each row takes the average rating off one strategy's, so the ratings are centred on 0
+        self.centre = np.eye(size, size + 1) - np.append(np.full(size, 1 / size), 0)
+
+    def add(self, strat1, strat2, player1, draw, player2):
+        self.results[strat1, strat2] = self.results[strat1, strat2] + (player1, draw, player2)
+
+    def games(self):
+        return int(self.results.sum())
+
+    def strategyGames(self, strat):
+        # The number of games the strategy played, counting games against itself once
+        return int(self.results[strat].sum() + self.results[:, strat].sum() - self.results[strat, strat].sum())
+
+    def fit(self):
+        # Fits the ratings to the results, starting from the last fit
+        results = self.results.reshape(-1, 3)
+        games = results.sum(axis=1)
+        scores = results[:, 0] + results[:, 1] / 2
+        precision = np.eye(len(self.parameters)) / self.prior**2
+        for _1 in range(100):
+            expected = 1 / (1 + np.exp(-self.design @ self.parameters))
+            gradient = self.design.T @ (scores - games * expected) - precision @ self.parameters
+            hessian = self.design.T @ (self.design * (games * expected * (1 - expected))[:, None]) + precision
+            step = np.linalg.solve(hessian, gradient)
+
+            # Steps are kept to 1 (about 170 Elo) so the first fits don't overshoot
+            largest = np.abs(step).max()
+            self.parameters = self.parameters + (step if (largest <= 1) else step / largest)
+            if (largest < 1e-9): break
+        self.covariance = np.linalg.inv(hessian)
+
+    def ratings(self):
+        # Returns each strategy's rating (centred on 0) and the half width of its 95% confidence interval, in Elo
+        values = self.centre @ self.parameters * eloScale
+        halfWidths = 1.96 * np.sqrt(np.einsum("ij,jk,ik->i", self.centre, self.covariance, self.centre)) * eloScale
+        return values, halfWidths
+
+    def firstMove(self):
+        return self.parameters[-1] * eloScale
+
+    def nextPair(self, batchGames):
+        # Returns the pair of strategies whose next batch of games would most reduce the variance of the widest rating.
+        # Adding the batch to the fit takes covariance @ row @ row.T @ covariance * information / (1 + information * variance)
+        # off the covariance, where variance is the variance of the pair's rating difference
+        widest = int(np.argmax(self.ratings()[1]))
+        expected = 1 / (1 + np.exp(-self.design @ self.parameters))
+        information = batchGames * expected * (1 - expected)
+        spread = self.covariance @ self.design.T
+        variance = np.einsum("ij,ji->i", self.design, spread)
+        reduction = (self.centre[widest] @ spread)**2 * information / (1 + information * variance)
+        return self.pairs[int(np.argmax(reduction))]
+
+def playRatingGames(player1Strategy, player2Strategy, NumGames, rng=None):
+    # Plays games between two strategy objects without learning from them, returning the number won by each player and
+    # drawn.  If rng is given the games are played with the batch engine (the strategies must have been prepared)
+    if (rng is not None):
+        boards, winners = playBatchGames(NumGames, player1Strategy, player2Strategy, rng)
+        player1 = int((winners == pieceValues[cfg_Player1]).sum())
+        player2 = int((winners == pieceValues[cfg_Player2]).sum())
+        return player1, NumGames - player1 - player2, player2
+
+    player1 = 0
+    player2 = 0
+    for _1 in range(NumGames):
+        winner = playGame(player1Strategy, player2Strategy, False)
+        if (winner == cfg_Player1): player1 = player1 + 1
+        elif (winner == cfg_Player2): player2 = player2 + 1
+    return player1, NumGames - player1 - player2, player2
+
+def rateStrategies(players, target, maxGames, batchGames=20, seed=None, batch=False, writer=None):
+    # Plays batches of games between the strategies until every rating's 95% interval is narrower than target (in Elo)
+    # or maxGames have been played, returning the Ratings.  If a ResultWriter is given, the ranking is passed to it at the end
+    ratings = Ratings(strategies)
+    rng = None
+    if (batch == True):
+        for name in strategies: players[name].prepare_batch()
+        rng = np.random.default_rng(seed)
+
+    firstRound = list(ratings.pairs)
+    while (ratings.games() < maxGames):
+        if (len(firstRound) > 0): strat1, strat2 = firstRound.pop(0)
+        else:
+            ratings.fit()
+            if (2 * ratings.ratings()[1].max() <= target): break
+            strat1, strat2 = ratings.nextPair(batchGames)
+            if (writer is not None): writer.updateRatings(ratings)
+
+        player1, draw, player2 = playRatingGames(players[strategies[strat1]], players[strategies[strat2]], batchGames, rng)
+        ratings.add(strat1, strat2, player1, draw, player2)
+
+    ratings.fit()
+    if (writer is not None): writer.updateRatings(ratings, True)
+    return ratings
+
 #############################################
 # Config Statements
 #############################################
 cfg_PrintBoard = False
 cfg_DebugStatements = False
 cfg_PrintResult = False
+cfg_BatchTesting = False # Play the testing games with the batch engine
+cfg_TournamentWorkers = 0 # Number of processes to play the testing games over (0 plays them in this process)
+cfg_Seed = None
+cfg_ModelFile = None # Load the learned tables from this file if it exists (skipping training) and save them to it at the end
+cfg_GameLogFile = None # Write every game played in this process to this file
+cfg_BatchTraining = False # Train the learning strategies with the batch engine
+cfg_TrainingWorkers = 0 # Number of processes to train the learning strategies over (0 trains them in this process)
+cfg_FreezeTesting = False # Stop the testing games from changing the learned tables
+cfg_TDLearning = None # A TDRule for ReinforcedLearning2 to learn with when batch training (None keeps the fixed updates)
+cfg_Profile = False # Count and time the moves, victory checks and learning updates, printing a summary at the end
+cfg_ProfileFile = None # Also write the profile to this file, as collapsed stacks if it ends in .folded or in pstats format otherwise
+cfg_TablebaseFile = None # Read the tablebase from this file rather than solving the game when a strategy needs it
+cfg_RatingTarget = 50.0 # Rate the strategies until every rating's 95% interval is narrower than this (in Elo)
+cfg_RatingBatch = 20 # Games played between a pair of strategies each time it is picked while rating
+cfg_RatingMaxGames = 1000000 # Stop rating after this many games even if some intervals are still too wide
+cfg_OutputFormat = "table" # How the results are written: "table", "csv" or "json"
+cfg_ProgressInterval = 5.0 # Seconds between progress lines on stderr during long runs (0 for none)
 cfg_Player1 = "O"
 # cfg_Player1Strategy = "WinRandom" 
 cfg_Player2 = "X"
@@ -568,23 +2313,141 @@ cfg_Player2 = "X"
 #############################################
 # Setup Game
 #############################################
-board = [[" ", " ", " "],[" ", " ", " "],[" ", " ", " "]]
-staticProbs = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
-dynamicProbs = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
-mlProbs = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
-scores = [[100, 100, 100], [100, 100, 100], [100, 100, 100]]
-
-statevalues = [100 for i in range(3**9)]
-
+board = Board()
 
 trainingstrategies = ["ReinforcedLearning1", "ReinforcedLearning2"]
-strategies = ["Random", "WinRandom", "BlockRandom", "StaticProbability", "DynamicProbability", "ReinforcedLearning1", "ReinforcedLearning2"]
-tableheader = ["P1 / D / P2", "Random", "WinRandom", "BlockRandom", "StaticProbability", "DynamicProbability", "ReinforcedLearning1", "ReinforcedLearning2"]
+strategies = ["Random", "WinRandom", "BlockRandom", "StaticProbability", "DynamicProbability", "ReinforcedLearning1", "ReinforcedLearning2", "Perfect"]
+# "MCTS" can be added to strategies as well, but each of its moves takes about as long as a thousand games
+tableheader = ["P1 / D / P2"] + strategies
 record = [["" for x in range(len(strategies))] for y in range(len(strategies))]
 
-if (cfg_PrintBoard == True): printBoard(board)
+def useStrategies(names):
+    # Plays the tournament between the given strategies rather than the default list.  The lists are changed in place so
+    # that anything holding on to them sees the new strategies
+    strategies[:] = names
+    tableheader[:] = ["P1 / D / P2"] + strategies
+    record[:] = [["" for x in range(len(strategies))] for y in range(len(strategies))]
 
-loopGames(1000, 1000)
-cfg_PrintBoard = True
-board = [[" ", " ", " "],[" ", " ", " "],[" ", " ", " "]]
-printStateValues(board, "O")
\ No newline at end of file
+def main(argv=None):
+    # Runs a tournament set up from the command line, with the cfg_ settings above as the defaults.  Run with --help to
+    # see the options, for example:
+    #
+    #   python TicTacToe.py --testing 1000000 --strategies Random Perfect MCTS --seed 1 --workers 4 --format csv > results.csv
+    global cfg_TablebaseFile
+    import argparse
+    parser = argparse.ArgumentParser(description="Plays every pair of strategies against each other and reports how often each one wins.")
+    parser.add_argument("--training", type=int, default=None, metavar="N",
+                        help="games to train the learning strategies for (default 1000, or 100000 with --batch-training)")
+    parser.add_argument("--testing", type=int, default=None, metavar="N",
+                        help="games to play between each pair of strategies (default 1000, or 100000 with --batch)")
+    parser.add_argument("--strategies", nargs="+", default=list(strategies), choices=sorted(strategyClasses), metavar="NAME",
+                        help="the strategies to play (default: " + " ".join(strategies) + ")")
+    parser.add_argument("--seed", type=int, default=cfg_Seed, help="random seed, so a run can be repeated")
+    parser.add_argument("--workers", type=int, default=cfg_TournamentWorkers, metavar="N",
+                        help="processes to play the testing games over (0 plays them in this process)")
+    parser.add_argument("--training-workers", type=int, default=cfg_TrainingWorkers, metavar="N",
+                        help="processes to train the learning strategies over (0 trains them in this process)")
+    parser.add_argument("--format", choices=ResultWriter.formats, default=cfg_OutputFormat, help="how the results are written")
+    parser.add_argument("--progress", type=float, default=cfg_ProgressInterval, metavar="SECONDS",
+                        help="seconds between progress lines on stderr (0 for none)")
+    parser.add_argument("--batch", action="store_true", default=cfg_BatchTesting, help="play the testing games with the batch engine")
+    parser.add_argument("--batch-training", action="store_true", default=cfg_BatchTraining, help="train with the batch engine")
+    parser.add_argument("--td", type=float, default=None, metavar="LAMBDA",
+                        help="batch train ReinforcedLearning2 with TD(lambda) rather than the fixed updates (implies --batch-training)")
+    parser.add_argument("--rate", action="store_true",
+                        help="rather than playing every pair the same number of games, play until the strategies' ratings are known to within --target")
+    parser.add_argument("--target", type=float, default=cfg_RatingTarget, metavar="ELO",
+                        help="with --rate, stop once every rating's 95%% interval is narrower than this")
+    parser.add_argument("--max-games", type=int, default=cfg_RatingMaxGames, metavar="N",
+                        help="with --rate, stop after this many games even if some intervals are still wider than --target")
+    parser.add_argument("--freeze", action="store_true", default=cfg_FreezeTesting, help="stop the testing games changing the learned tables")
+    parser.add_argument("--model", default=cfg_ModelFile, metavar="FILE",
+                        help="load the learned tables from this file if it exists (skipping training) and save them to it at the end")
+    parser.add_argument("--tablebase", default=cfg_TablebaseFile, metavar="FILE",
+                        help="read the tablebase from this file, solving the game and writing it there first if it doesn't exist")
+    parser.add_argument("--seed-statevalues", action="store_true",
+                        help="start ReinforcedLearning2 from the tablebase's value of each board rather than a flat 100")
+    parser.add_argument("--game-log", default=cfg_GameLogFile, metavar="FILE", help="write every game played in this process to this file")
+    parser.add_argument("--profile", action="store_true", default=cfg_Profile, help="print a profile of the moves and learning updates")
+    parser.add_argument("--profile-file", default=cfg_ProfileFile, metavar="FILE",
+                        help="also write the profile here, as collapsed stacks if it ends in .folded or in pstats format otherwise")
+    args = parser.parse_args(argv)
+    for option in ["training", "testing"]:
+        if (getattr(args, option) is not None and getattr(args, option) < 0): parser.error("--" + option + " can't be negative")
+
+    # TD learning is only done by the batch engine
+    if (args.td is not None): args.batch_training = True
+    if (args.workers < 0 or args.training_workers < 0): parser.error("the number of workers can't be negative")
+    if (args.rate == True and args.workers > 0): parser.error("--rate picks each batch of games from the results so far, so can't use --workers")
+    if (args.batch == True and args.workers > 0): parser.error("--batch plays the games in this process, so can't use --workers")
+    if (args.batch_training == True and args.training_workers > 0):
+        parser.error("--batch-training (and --td) train in this process, so can't use --training-workers")
+    if (args.batch == True):
+        unbatched = [name for name in args.strategies if (strategyClasses[name].choose_batch_moves is Strategy.choose_batch_moves)]
+        if (len(unbatched) > 0): parser.error("--batch can't play " + ", ".join(unbatched) + ", which can only play one game at a time")
+    if (args.target <= 0 or args.max_games <= 0): parser.error("--target and --max-games must be positive")
+
+    useStrategies(args.strategies)
+    writer = ResultWriter(args.format, progress=sys.stderr if (args.progress > 0) else None, interval=args.progress)
+    TrainingGames = args.training if (args.training is not None) else (100000 if (args.batch_training == True) else 1000)
+    TestingGames = args.testing if (args.testing is not None) else (100000 if (args.batch == True) else 1000)
+    td = TDRule(trace=args.td) if (args.td is not None) else cfg_TDLearning
+
+    if (cfg_PrintBoard == True): printBoard(board)
+    if (args.profile == True): enableProfiling()
+    if (args.tablebase is not None):
+        if (not os.path.exists(args.tablebase)):
+            writer.status("Writing the tablebase to " + args.tablebase)
+            writeTablebase(args.tablebase)
+        cfg_TablebaseFile = args.tablebase
+    players = makePlayers(strategies)
+    if (args.seed_statevalues == True): seedStateValues(players["ReinforcedLearning2"].statevalues, getTablebase())
+    if (args.game_log is not None): openGameLog(args.game_log, list(players))
+
+    if (args.model is not None and os.path.exists(args.model)):
+        # The tables have already been learned
+        writer.status("Loading the learned tables from " + args.model)
+        loadModel(args.model, players)
+        TrainingGames = 0
+    elif (args.batch_training == True):
+        writer.status("Batch training for %d games" % TrainingGames)
+        batchTrainStrategies(players, TrainingGames, td=td, seed=args.seed)
+        TrainingGames = 0
+    elif (args.training_workers > 0):
+        writer.status("Training for %d games over %d workers" % (TrainingGames, args.training_workers))
+        runParallelTraining(players, TrainingGames, args.seed, args.training_workers)
+        TrainingGames = 0
+
+    if (args.rate == True):
+        writer.status("Rating %d strategies to within %.0f%s" % (len(strategies), args.target,
+                                                                 "" if (TrainingGames == 0) else " after %d training games" % TrainingGames))
+    else:
+        writer.status("Playing %d testing games for each of %d pairs%s" % (TestingGames, len(strategies)**2,
+                                                                           "" if (TrainingGames == 0) else " after %d training games" % TrainingGames))
+    if (args.rate == True):
+        seedRandom(args.seed)
+        trainStrategies(players, TrainingGames)
+        rateStrategies(players, args.target, args.max_games, cfg_RatingBatch, args.seed, args.batch, writer)
+    elif (args.workers > 0):
+        runTournament(players, TrainingGames, TestingGames, args.seed, args.workers, modelFile=args.model, freeze=args.freeze, writer=writer)
+    elif (args.batch == True):
+        seedRandom(args.seed)
+        trainStrategies(players, TrainingGames)
+        loopBatchGames(players, TestingGames, args.seed, writer)
+    else:
+        seedRandom(args.seed)
+        loopGames(players, TrainingGames, TestingGames, args.freeze, writer)
+
+    if (args.model is not None): saveModel(args.model, players)
+    closeGameLog()
+    if (args.profile == True):
+        stats = disableProfiling()
+        # Keep the profile out of CSV or JSON results
+        printProfileStats(stats, sys.stdout if (args.format == "table") else sys.stderr)
+        if (args.profile_file is not None and args.profile_file.endswith(".folded")): dumpCollapsedStacks(stats, args.profile_file)
+        elif (args.profile_file is not None): dumpProfileStats(stats, args.profile_file)
+
+    if (args.format == "table"): printStateValues(Board(), "O", players["ReinforcedLearning2"].statevalues)
+
+if __name__ == "__main__":
+    main()
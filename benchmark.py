@@ -0,0 +1,282 @@
+#############################################
+# Benchmarks for TicTacToe.py
+#############################################
+# Times whole games and the functions used on every move, writing the results as JSON and comparing them with a saved
+# baseline.  Run with:
+#
+#   python benchmark.py
+#
+# Run with --sampling to compare the move selection functions with the versions they replaced instead (benchmarkSampling).
+#############################################
+
+from random import random, seed as seedRandom
+import contextlib
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import TicTacToe as ttt
+
+#############################################
+# Previous implementations, kept to compare against
+#############################################
+
+def rejectionRandomCell(board):
+    # Picks random cells until we find an empty one
+    occupied = board.counters["O"] | board.counters["X"]
+    while True:
+        row = math.floor(random() * 3)
+        col = math.floor(random() * 3)
+        if (occupied & ttt.cellBits[row * 3 + col] == 0): return row * 3 + col
+
+def rejectionProbabilityCell(board, probabilities):
+    # Draws until the first empty cell with a higher cumulative probability is found
+    occupied = board.counters["O"] | board.counters["X"]
+    while True:
+        draw = random()
+        for cell in range(9):
+            if (probabilities[cell] > draw and occupied & ttt.cellBits[cell] == 0): return cell
+
+#############################################
+# Helpers
+#############################################
+
+def randomBoard(counters):
+    # Plays random moves until the board has the given number of counters and no winner
+    while True:
+        board = ttt.Board()
+        for move in range(counters):
+            ttt.placeCounter(board, ttt.getRandomCell(board), "O" if (move % 2 == 0) else "X")
+        if (ttt.checkVictory(board) == "No Winner"): return board
+
+def copyMoves(board):
+    # Tries every move on a board by copying it for each one, as the solver used to
+    occupied = board.counters["O"] | board.counters["X"]
+    for cell in ttt.emptyCellLists[occupied]:
+        board2 = ttt.copyBoard(board)
+        ttt.placeCounter(board2, cell, "O")
+
+def makeUnmakeMoves(board):
+    # Tries every move on a board by placing a counter and taking it back
+    occupied = board.counters["O"] | board.counters["X"]
+    for cell in ttt.emptyCellLists[occupied]:
+        ttt.placeCounter(board, cell, "O")
+        ttt.removeCounter(board, cell, "O")
+
+def movesPerSecond(function, boards, repeats):
+    # Returns the number of calls per second of function over each board
+    start = time.perf_counter()
+    for _1 in range(repeats):
+        for board in boards:
+            function(board)
+    return repeats * len(boards) / (time.perf_counter() - start)
+
+def cellFrequencies(function, board, draws):
+    # Returns how often each cell is picked
+    counts = [0 for cell in range(9)]
+    for _1 in range(draws):
+        cell = function(board)
+        counts[cell] = counts[cell] + 1
+    return [count / draws for count in counts]
+
+#############################################
+# Sampling
+#############################################
+
+def benchmarkSampling(repeats=2000, draws=50000):
+    # Compares getRandomCell and getProbabilityCell with the rejection sampling versions, both for speed and for how often
+    # each cell is picked.  Boards with more counters on them needed more draws before
+    seedRandom(1)
+    probabilities = ttt.generateStaticProbabilities(ttt.Board())
+
+    samplers = [("getRandomCell", rejectionRandomCell, ttt.getRandomCell),
+                ("getProbabilityCell", lambda board: rejectionProbabilityCell(board, probabilities), lambda board: ttt.getProbabilityCell(board, probabilities))]
+
+    for name, before, after in samplers:
+        print(name)
+        for counters in [0, 4, 7]:
+            boards = [randomBoard(counters) for i in range(20)]
+            beforeRate = movesPerSecond(before, boards, repeats // 20)
+            afterRate = movesPerSecond(after, boards, repeats // 20)
+
+            # The largest difference in how often any cell is picked on one of the boards
+            difference = max(abs(b - a) for b, a in zip(cellFrequencies(before, boards[0], draws), cellFrequencies(after, boards[0], draws)))
+
+            print("    %d counters: %10.0f moves/sec before, %10.0f moves/sec after (x%.1f), largest frequency difference %.4f"
+                  % (counters, beforeRate, afterRate, afterRate / beforeRate, difference))
+
+#############################################
+# Benchmark Suite
+#############################################
+# Times whole games for each strategy and the functions called on every move, with fixed seeds and a warmup before
+# anything is timed.  Each timing is the best of several repeats, to keep noise from other processes out of the results.
+# The results are written as JSON and, if a baseline file exists, compared against it so that regressions show up.
+#############################################
+
+cfg_Seed = 1
+cfg_Repeats = 5
+cfg_ResultsFile = "benchmark.json"
+cfg_BaselineFile = "benchmark_baseline.json"
+cfg_Tolerance = 0.10
+
+def bestTime(function, repeats):
+    # Returns the fastest of several runs of function, in seconds, after one run to warm up
+    seedRandom(cfg_Seed)
+    function()
+    times = []
+    for _1 in range(repeats):
+        seedRandom(cfg_Seed)
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmarkGames(players, opponent="DynamicProbability", NumGames=10000, repeats=cfg_Repeats):
+    # Returns the games per second for each strategy playing first against the same opponent.  The learning strategies
+    # are reset between repeats so every run plays the same games
+    results = {}
+    for name in ttt.strategies:
+        def play():
+            players[name] = ttt.strategyClasses[name]()
+            for _1 in range(NumGames):
+                ttt.playGame(players[name], players[opponent])
+        results[name] = NumGames / bestTime(play, repeats)
+    return results
+
+def benchmarkFunctions(calls=50000, repeats=cfg_Repeats):
+    # Returns the time per call in nanoseconds of the functions used on every move, over a fixed set of boards
+    seedRandom(cfg_Seed)
+    boards = [randomBoard(counters) for counters in range(9) for i in range(calls // 90)]
+    probabilities = ttt.generateStaticProbabilities(ttt.Board())
+
+    functions = [("checkVictory", ttt.checkVictory),
+                 ("checkWinningCell", lambda board: ttt.checkWinningCell(board, "O", "X")),
+                 ("translateBoardSate", ttt.translateBoardSate),
+                 ("getProbabilityCell", lambda board: ttt.getProbabilityCell(board, probabilities)),
+                 ("copyMoves", copyMoves),
+                 ("makeUnmakeMoves", makeUnmakeMoves)]
+
+    results = {}
+    for name, function in functions:
+        rate = max(movesPerSecond(function, boards, 10) for _1 in range(repeats))
+        results[name] = 1e9 / rate
+    return results
+
+def benchmarkSearch(NumGames=20):
+    # Returns the rollouts per second of the MCTS strategy over a few games against DynamicProbability
+    seedRandom(cfg_Seed)
+    players = ttt.makeStrategies(["MCTS", "DynamicProbability"])
+    for _1 in range(NumGames):
+        ttt.playGame(players["MCTS"], players["DynamicProbability"])
+    return {"MCTS": players["MCTS"].rolloutsPerSecond()}
+
+def benchmarkMemory(players, TrainingGames=1000):
+    # Returns the peak memory allocated in bytes while training the learning strategies, while setting up the batch
+    # tables, while solving the game and while MCTS plays a game.  The solver and MCTS make and take back their moves on
+    # one board, so they should only need the memory for their tables.  tracemalloc slows everything down, so this is
+    # kept apart from the timings
+    seedRandom(cfg_Seed)
+    ttt.buildMoveTables()
+    search = ttt.makeStrategies(["MCTS", "DynamicProbability"])
+    results = {}
+    tracemalloc.start()
+    ttt.trainStrategies(players, TrainingGames)
+    results["trainStrategies"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    for name in ttt.strategies: players[name].prepare_batch()
+    results["prepare_batch"] = tracemalloc.get_traced_memory()[1]
+
+    ttt.perfectCells = None
+    ttt.transpositionTable = None
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    ttt.solveGame()
+    results["solveGame"] = tracemalloc.get_traced_memory()[1] - start
+
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    ttt.playGame(search["MCTS"], search["DynamicProbability"])
+    results["mctsGame"] = tracemalloc.get_traced_memory()[1] - start
+    tracemalloc.stop()
+    return results
+
+def benchmarkCopies():
+    # Returns the number of boards copied while solving the game, while printing the statevalues and while MCTS plays a
+    # game.  Searches make and take back their moves on one board, so these should all be 0
+    copyBoard = ttt.copyBoard
+    copies = [0]
+    def countingCopyBoard(board):
+        copies[0] = copies[0] + 1
+        return copyBoard(board)
+
+    seedRandom(cfg_Seed)
+    players = ttt.makeStrategies(["MCTS", "DynamicProbability", "ReinforcedLearning2"])
+    searches = [("solveGame", ttt.solveGame),
+                ("printStateValues", lambda: ttt.printStateValues(ttt.Board(), "O", players["ReinforcedLearning2"].statevalues)),
+                ("mctsGame", lambda: ttt.playGame(players["MCTS"], players["DynamicProbability"]))]
+
+    results = {}
+    ttt.copyBoard = countingCopyBoard
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for name, search in searches:
+                copies[0] = 0
+                search()
+                results[name] = copies[0]
+    finally:
+        ttt.copyBoard = copyBoard
+    return results
+
+def runBenchmarks():
+    # Runs every benchmark, returning the results as a dict that can be written as JSON
+    players = ttt.makeStrategies(ttt.strategies)
+    return {"python": platform.python_version(),
+            "seed": cfg_Seed,
+            "games_per_sec": benchmarkGames(players),
+            "ns_per_call": benchmarkFunctions(),
+            "rollouts_per_sec": benchmarkSearch(),
+            "peak_memory_bytes": benchmarkMemory(ttt.makeStrategies(ttt.strategies)),
+            "board_copies": benchmarkCopies()}
+
+def compareResults(results, baseline, tolerance=cfg_Tolerance):
+    # Prints each result next to the baseline, returning the names of any that are worse by more than the tolerance.
+    # More games and rollouts per second are better, while lower ns per call, memory and board copies are better
+    regressions = []
+    for section, higherIsBetter in [("games_per_sec", True), ("ns_per_call", False), ("rollouts_per_sec", True), ("peak_memory_bytes", False),
+                                    ("board_copies", False)]:
+        print(section)
+        for name, value in results[section].items():
+            if (name not in baseline.get(section, {})):
+                print("    %-20s %14.1f (no baseline)" % (name, value))
+                continue
+
+            if (baseline[section][name] == 0): change = 0.0 if (value == 0) else math.inf
+            else: change = value / baseline[section][name] - 1
+            worse = (change < -tolerance) if (higherIsBetter == True) else (change > tolerance)
+            if (worse == True): regressions.append(section + "/" + name)
+            print("    %-20s %14.1f %14.1f %+7.1f%%%s" % (name, baseline[section][name], value, change * 100, "  REGRESSION" if (worse == True) else ""))
+
+    return regressions
+
+if __name__ == "__main__":
+    if ("--sampling" in sys.argv[1:]):
+        benchmarkSampling()
+        sys.exit(0)
+
+    results = runBenchmarks()
+    with open(cfg_ResultsFile, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if (os.path.exists(cfg_BaselineFile)):
+        with open(cfg_BaselineFile) as f:
+            regressions = compareResults(results, json.load(f))
+        if (len(regressions) > 0):
+            print("Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+        print("No baseline found, copy " + cfg_ResultsFile + " to " + cfg_BaselineFile + " to compare later runs against it")
@@ -0,0 +1,339 @@
+#############################################
+# Checks for TicTacToe.py
+#############################################
+# Checks the solver and the other parts that are easy to get subtly wrong against simple versions that are easy to
+# trust, printing the result of each check.  Run with:
+#
+#   python checks.py
+#
+# Exits with 1 if any check fails.
+#############################################
+
+from random import seed as seedRandom
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import traceback
+
+import TicTacToe as ttt
+
+checks = []
+
+def check(function):
+    # Adds a function to the checks that are run.  A check passes unless it raises an exception
+    checks.append(function)
+    return function
+
+#############################################
+# Simple versions, kept to check against
+#############################################
+
+def bruteForceValue(board, Me, Enemy, values):
+    # Returns the value of the board for Me (who is about to move) in the solver's terms, looking at every move with no
+    # pruning.  values holds the boards that have already been worked out
+    if (board.key in values): return values[board.key]
+
+    occupied = board.counters["O"] | board.counters["X"]
+    bestValue = None
+    for cell in ttt.emptyCellLists[occupied]:
+        value = bruteForceMoveValue(board, cell, Me, Enemy, values)
+        if (bestValue is None or value > bestValue): bestValue = value
+
+    values[board.key] = bestValue
+    return bestValue
+
+def bruteForceMoveValue(board, cell, Me, Enemy, values):
+    # Returns the value for Me of placing a counter in the cell
+    occupied = board.counters["O"] | board.counters["X"]
+    ttt.placeCounter(board, cell, Me)
+    if (ttt.victoryTable[board.counters[Me]] == True): value = 10 - ttt.counterCounts[occupied | ttt.cellBits[cell]]
+    elif (occupied | ttt.cellBits[cell] == 0b111111111): value = 0
+    else: value = -bruteForceValue(board, Enemy, Me, values)
+    ttt.removeCounter(board, cell, Me)
+    return value
+
+def unfinishedBoards(board, Me, Enemy, seen):
+    # Yields (board, Me, Enemy) once for every board without a winner and with an empty cell that can follow the board
+    if (board.key in seen): return
+    seen.add(board.key)
+    yield board, Me, Enemy
+
+    occupied = board.counters["O"] | board.counters["X"]
+    for cell in ttt.emptyCellLists[occupied]:
+        ttt.placeCounter(board, cell, Me)
+        if (ttt.victoryTable[board.counters[Me]] == False and occupied | ttt.cellBits[cell] != 0b111111111):
+            yield from unfinishedBoards(board, Enemy, Me, seen)
+        ttt.removeCounter(board, cell, Me)
+
+def bruteForceHasLine(counters, rows, cols, k):
+    # Whether the counters have k in a row anywhere, counting the run across, down and along both diagonals from every
+    # counter that starts one
+    placed = {(cell // cols, cell % cols) for cell in range(rows * cols) if (counters >> cell & 1)}
+    for row, col in placed:
+        for rowStep, colStep in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+            if ((row - rowStep, col - colStep) in placed): continue
+            run = 1
+            while ((row + run * rowStep, col + run * colStep) in placed): run = run + 1
+            if (run >= k): return True
+    return False
+
+#############################################
+# Board Geometry
+#############################################
+
+@check
+def checkGenericGeometry():
+    # The generic methods of a 3x3 Geometry give the same answers as the tables TicTacToeGeometry looks them up in, for
+    # every set of counters and (for winningCell) every board
+    generic = ttt.Geometry(3, 3, 3)
+    standard = ttt.standardGeometry
+    for counters in range(512):
+        assert generic.hasLine(counters) == standard.hasLine(counters), "counters " + str(counters)
+        assert generic.emptyCells(counters) == standard.emptyCells(counters), "counters " + str(counters)
+        for cell in range(9):
+            # A move can only complete a line through its own cell, so the tables only agree when there wasn't a line before
+            if (counters & ttt.cellBits[cell] and not ttt.victoryTable[counters & ~ttt.cellBits[cell]]):
+                assert generic.completesLine(counters, cell) == standard.completesLine(counters, cell), "counters " + str(counters) + " cell " + str(cell)
+
+    for key in range(3**9):
+        noughts, crosses = ttt.keyCounters(key)
+        boards = [ttt.Board(standard), ttt.Board(generic)]
+        for board in boards:
+            for cell in range(9):
+                if (noughts & ttt.cellBits[cell]): ttt.placeCounter(board, cell, "O")
+                if (crosses & ttt.cellBits[cell]): ttt.placeCounter(board, cell, "X")
+        assert boards[0].key == key
+        for Me in ["O", "X"]:
+            assert generic.winningCell(boards[1], Me) == standard.winningCell(boards[0], Me), "board " + str(key) + " for " + Me
+
+@check
+def checkLargerBoards():
+    # On larger boards, random games find a winner exactly when a scan of the whole board finds a line, and the board key
+    # is the sum of the Zobrist numbers of the counters on it, going back to 0 once every move is taken back.  Games on
+    # the 4x4 board are short, so it plays plenty of them to reach every line
+    seedRandom(1)
+    for rows, cols, k, NumGames in [(4, 4, 3, 1000), (15, 15, 5, 20)]:
+        geometry = ttt.Geometry(rows, cols, k)
+        for _1 in range(NumGames):
+            board = ttt.Board(geometry)
+            moves = []
+            Me = "O"
+            while True:
+                cell = ttt.getRandomCell(board)
+                ttt.placeCounter(board, cell, Me)
+                moves.append((cell, Me))
+                line = bruteForceHasLine(board.counters[Me], rows, cols, k)
+                assert geometry.completesLine(board.counters[Me], cell) == line, str((rows, cols, k)) + " moves " + str(moves)
+                assert ttt.checkVictory(board, cell, Me) == (Me if (line == True) else "No Winner")
+                assert ttt.checkVictory(board) == ttt.checkVictory(board, cell, Me)
+                assert board.key == sum(geometry.zobrist[player][cell] for cell, player in moves)
+                if (line == True or len(moves) == geometry.cells): break
+                Me = ttt.opponents[Me]
+
+            for cell, player in reversed(moves): ttt.removeCounter(board, cell, player)
+            assert board.key == 0 and board.counters == {"O": 0, "X": 0}
+
+#############################################
+# Solver
+#############################################
+
+@check
+def checkSolver():
+    # Every board that can be reached has perfect cells, and they are exactly the moves with the best brute force value
+    ttt.perfectCells = None
+    ttt.transpositionTable = None
+    ttt.solveGame()
+
+    values = {}
+    boards = 0
+    for board, Me, Enemy in unfinishedBoards(ttt.Board(), ttt.cfg_Player1, ttt.cfg_Player2, set()):
+        boards = boards + 1
+        occupied = board.counters["O"] | board.counters["X"]
+        moveValues = {cell: bruteForceMoveValue(board, cell, Me, Enemy, values) for cell in ttt.emptyCellLists[occupied]}
+        best = [cell for cell in moveValues if (moveValues[cell] == max(moveValues.values()))]
+        assert sorted(ttt.perfectCells[board.key]) == best, "board " + str(board.key) + ": " + str(ttt.perfectCells[board.key]) + " != " + str(best)
+
+    assert boards == 4520, str(boards) + " boards"
+    assert sum(cells is not None for cells in ttt.perfectCells) == boards
+
+@check
+def checkPerfectNeverLoses():
+    seedRandom(1)
+    players = ttt.makeStrategies(["Perfect", "Random", "DynamicProbability"])
+    for opponent in ["Random", "DynamicProbability"]:
+        for _1 in range(1000):
+            assert ttt.playGame(players["Perfect"], players[opponent]) != ttt.cfg_Player2
+            assert ttt.playGame(players[opponent], players["Perfect"]) != ttt.cfg_Player1
+
+#############################################
+# Batch Engine
+#############################################
+
+@check
+def checkBatchResults(NumGames=2000):
+    # The batch engine wins, draws and loses as often as playing the games one at a time, to within 4.5 standard errors
+    import numpy as np
+    seedRandom(1)
+    rng = np.random.default_rng(1)
+    names = ["Random", "WinRandom", "BlockRandom", "DynamicProbability", "Perfect"]
+    players = ttt.makeStrategies(names)
+    for name in names: players[name].prepare_batch()
+
+    for name1 in names:
+        for name2 in names:
+            winners = [ttt.playGame(players[name1], players[name2], False) for _1 in range(NumGames)]
+            scalar = np.array([winners.count(ttt.cfg_Player1), winners.count("No Winner"), winners.count(ttt.cfg_Player2)]) / NumGames
+            batchWinners = ttt.playBatchGames(NumGames, players[name1], players[name2], rng)[1]
+            batch = np.array([(batchWinners == 1).sum(), (batchWinners == 0).sum(), (batchWinners == 2).sum()]) / NumGames
+
+            mean = (scalar + batch) / 2
+            limit = 4.5 * np.sqrt(np.maximum(mean * (1 - mean), 1 / NumGames) * 2 / NumGames)
+            assert (np.abs(scalar - batch) <= limit).all(), name1 + " v " + name2 + ": " + str(scalar) + " != " + str(batch)
+
+#############################################
+# Files
+#############################################
+
+@check
+def checkModelFile():
+    # The tables read back from a model file are the ones saved, including when the file being saved over is the one the
+    # tables were loaded from, and a second run with the same --model leaves the file intact
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "model.bin")
+        seedRandom(1)
+        players = ttt.makePlayers(["Random"])
+        ttt.trainStrategies(players, 200)
+        ttt.saveModel(path, players)
+
+        loaded = ttt.makePlayers(["Random"])
+        ttt.loadModel(path, loaded)
+        for name, table in [("ReinforcedLearning1", "scores"), ("ReinforcedLearning2", "statevalues")]:
+            assert list(getattr(loaded[name], table)) == list(getattr(players[name], table)), name + " " + table
+
+        ttt.trainStrategies(loaded, 200)
+        ttt.saveModel(path, loaded)
+        again = ttt.makePlayers(["Random"])
+        ttt.loadModel(path, again)
+        for name, table in [("ReinforcedLearning1", "scores"), ("ReinforcedLearning2", "statevalues")]:
+            assert list(getattr(again[name], table)) == list(getattr(loaded[name], table)), name + " " + table + " after saving over the file"
+
+        size = os.path.getsize(path)
+        for extra in [[], ["--freeze"]]:
+            subprocess.run([sys.executable, ttt.__file__, "--model", path, "--testing", "10", "--strategies", "Random", "--progress", "0",
+                            "--format", "csv"] + extra, check=True, stdout=subprocess.DEVNULL)
+            assert os.path.getsize(path) == size, "the model file is " + str(os.path.getsize(path)) + " bytes"
+
+def playLoggedGames(players, names, NumGames):
+    # Plays NumGames between every pair of the named strategies, returning (player 1, player 2, winner, cells) for each
+    played = []
+    for name1 in names:
+        for name2 in names:
+            for _1 in range(NumGames):
+                game = ttt.Game(players[name1], players[name2], False)
+                game.play()
+                played.append((name1, name2, game.winner, list(game.cells)))
+    return played
+
+@check
+def checkGameLog():
+    # Every game played while logging is read back with the same strategies, winner and cells, and summariseGameLog
+    # counts them.  Tournament workers don't add anything to the log, however many games they play
+    names = ["Random", "WinRandom", "Perfect"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "games.log")
+        seedRandom(1)
+        players = ttt.makeStrategies(names)
+        ttt.openGameLog(path, names)
+        try: played = playLoggedGames(players, names, 100)
+        finally: ttt.closeGameLog()
+
+        assert list(ttt.readGameLog(path, chunkSize=64)) == played
+        counts = {}
+        for name1, name2, winner, cells in played:
+            result = counts.setdefault((name1, name2), [0, 0, 0])
+            result[[ttt.cfg_Player1, "No Winner", ttt.cfg_Player2].index(winner)] += 1
+        assert ttt.summariseGameLog(path) == counts
+
+        # The workers would fill a buffer this small many times over
+        previous = list(ttt.strategies)
+        ttt.useStrategies(names[:2])
+        ttt.gameLog = ttt.GameLog(path, names, bufferSize=50)
+        try:
+            ttt.runTournament(ttt.makePlayers(ttt.strategies), 0, 500, 1, workers=1, writer=ttt.ResultWriter("csv", out=io.StringIO()))
+            played = playLoggedGames(players, names, 10)
+        finally:
+            ttt.closeGameLog()
+            ttt.useStrategies(previous)
+        assert list(ttt.readGameLog(path)) == played
+
+def bruteForceResult(board, Me, Enemy, results):
+    # Returns the (result, distance) of the board for Me, who is about to move, looking at every move.  Of the moves with
+    # the best result, a win is taken as soon as possible and a loss put off for as long as possible
+    if (board.key in results): return results[board.key]
+
+    occupied = board.counters["O"] | board.counters["X"]
+    if (ttt.victoryTable[board.counters[Enemy]] == True): results[board.key] = (-1, 0)
+    elif (occupied == 0b111111111): results[board.key] = (0, 0)
+    else:
+        best = None
+        for cell in ttt.emptyCellLists[occupied]:
+            ttt.placeCounter(board, cell, Me)
+            result, distance = bruteForceResult(board, Enemy, Me, results)
+            ttt.removeCounter(board, cell, Me)
+            rank = (-result, distance + 1 if (result == 1) else -distance - 1)
+            if (best is None or rank > best[0]): best = (rank, (-result, distance + 1))
+        results[board.key] = best[1]
+    return results[board.key]
+
+@check
+def checkTablebase():
+    # The tablebase has the brute force result and distance for every board that can be reached (and nothing else), its
+    # best cells are perfect cells, and it reads back from a file unchanged
+    boards = ttt.generateTablebase()
+    tablebase = ttt.Tablebase(boards)
+    results = {}
+    bruteForceResult(ttt.Board(), ttt.cfg_Player1, ttt.cfg_Player2, results)
+    assert len(results) == 5478 and sum(distance >= 0 for distance in tablebase.distances) == len(results)
+    for key, (result, distance) in results.items():
+        assert (tablebase.results[key], tablebase.distances[key]) == (result, distance), "board " + str(key)
+
+    ttt.solveGame()
+    for key in range(3**9):
+        if (tablebase.bestCells[key] is not None): assert set(tablebase.bestCells[key]) <= set(ttt.perfectCells[key]), "board " + str(key)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tablebase.bin")
+        ttt.writeTablebase(path, boards)
+        assert os.path.getsize(path) == 12 + 4 * len(boards)
+        loaded = ttt.readTablebase(path)
+        assert (loaded.results, loaded.distances, loaded.bestCells) == (tablebase.results, tablebase.distances, tablebase.bestCells)
+
+        with open(path, "r+b") as tablebaseFile: tablebaseFile.write(b"TTTM")
+        try: ttt.readTablebase(path)
+        except ValueError: pass
+        else: raise AssertionError("read a file that isn't a tablebase")
+
+#############################################
+# Running the Checks
+#############################################
+
+def runChecks():
+    # Runs every check, returning the names of the ones that failed
+    failures = []
+    for function in checks:
+        try:
+            function()
+            print("PASS " + function.__name__)
+        except Exception:
+            failures.append(function.__name__)
+            print("FAIL " + function.__name__)
+            traceback.print_exc()
+    return failures
+
+if __name__ == "__main__":
+    failures = runChecks()
+    if (len(failures) > 0):
+        print("Failed: " + ", ".join(failures))
+        sys.exit(1)
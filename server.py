@@ -0,0 +1,384 @@
+#############################################
+# Game Server for TicTacToe.py
+#############################################
+# Serves moves from the strategies in TicTacToe.py to many clients at once.  Clients connect over plain TCP on
+# localhost and send one JSON request per line, getting one JSON response per line back, so a client can keep its
+# connection open and send any number of requests over it.  Run with:
+#
+#   python server.py serve [--port 8765] [--workers N]
+#   python server.py load [--clients 50] [--requests 20000] [--strategies Perfect DynamicProbability] [--spawn]
+#
+# The requests are:
+#
+#   {"op": "new", "strategy": "Perfect", "player": "X"}    Starts a game with the server playing the strategy as the given
+#                                                          player ("X" by default).  Returns {"game": id}, along with the
+#                                                          server's first move if it plays first
+#   {"op": "play", "game": id, "cell": 4}                  Plays the client's move, then the server's reply.  Returns
+#                                                          {"cell": reply, "winner": ..., "over": ...}
+#   {"op": "move", "strategy": "MCTS", "cells": [4, 0]}    Returns {"cell": move}, the move the strategy would make after
+#                                                          the given moves (O moves first), without starting a game
+#   {"op": "end", "game": id}                              Forgets a game before it has finished
+#
+# "new" and "move" can also give "rows", "cols" and "k" to play on a board other than 3x3.  Any request can include an
+# "id", which is copied into its response, and a request that can't be answered gets {"error": message}.  Finished games
+# are forgotten as soon as the result has been sent.
+#
+# Most strategies pick a move with a table lookup, which is quicker than handing the move to another process, so they
+# are played in the event loop.  The strategies in cfg_ExecutorStrategies (MCTS by default) are sent to a pool of worker
+# processes so they don't hold up the other clients.  The solver's tables are built once when the server starts (and in
+# each worker), so Perfect moves are lookups too.
+#############################################
+
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+from time import perf_counter
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+
+import TicTacToe as ttt
+
+cfg_Host = "127.0.0.1"
+cfg_Port = 8765
+cfg_ExecutorStrategies = ["MCTS"]
+cfg_MaxGames = 100000 # Games held in memory at once, so clients that never finish their games can't use up the memory
+cfg_MaxCells = 400 # Largest board a client can ask for
+cfg_MaxGeometries = 8 # Different boards the server will play on, as each one has its own tables for every strategy (up to 16MB each)
+
+#############################################
+# Strategies
+#############################################
+# Every game on the same board geometry shares one strategy object for each strategy.  The games aren't learned from,
+# so the strategies only change while picking a move (MCTS keeps its tree for the game it was last asked about).
+# Geometries and strategies are kept for as long as the server runs, so only cfg_MaxGeometries different boards are
+# played on and a client asking for another one is refused.
+#############################################
+
+geometries = {(3, 3, 3): ttt.standardGeometry}
+players = {}
+
+def geometryFor(rows, cols, k):
+    # Returns the geometry for an m x n board with k in a row, creating it the first time it is asked for
+    for value in [rows, cols, k]:
+        if (type(value) is not int or value < 1): raise ValueError("rows, cols and k must be positive integers")
+    if (rows * cols > cfg_MaxCells): raise ValueError("Boards can have at most " + str(cfg_MaxCells) + " cells")
+    if ((rows, cols, k) not in geometries):
+        if (len(geometries) >= cfg_MaxGeometries): raise ValueError("The server can't play on any more board sizes")
+        geometries[(rows, cols, k)] = ttt.Geometry(rows, cols, k)
+    return geometries[(rows, cols, k)]
+
+def strategyFor(name, geometry):
+    # Returns the strategy object with the given name for a geometry
+    if (name not in ttt.strategyClasses): raise ValueError("Unknown strategy: " + str(name))
+    if ((name, geometry) not in players): players[(name, geometry)] = ttt.strategyClasses[name](geometry)
+    return players[(name, geometry)]
+
+def warmTables(modelFile=None):
+    # Builds the tables the strategies look moves up in, so the first clients don't wait for them, and loads any learned
+    # tables for ReinforcedLearning1 and ReinforcedLearning2
+    ttt.buildMoveTables()
+    ttt.solveGame()
+    if (modelFile is not None):
+        learners = {name: strategyFor(name, ttt.standardGeometry) for name in ttt.trainingstrategies}
+        ttt.loadModel(modelFile, learners)
+
+def replayCells(game, cells):
+    # Plays each of the given cells in turn, checking that each one is a legal move
+    if (type(cells) is not list): raise ValueError("cells must be a list of the cells played")
+    for cell in cells:
+        checkMove(game, cell)
+        game.playMove(cell)
+
+def checkMove(game, cell):
+    # Raises a ValueError if the cell can't be played next
+    board = game.board
+    if (game.winner != "No Winner" or len(game.cells) == board.geometry.cells): raise ValueError("The game is over")
+    if (type(cell) is not int or not 0 <= cell < board.geometry.cells): raise ValueError("Not a cell: " + str(cell))
+    if ((board.counters["O"] | board.counters["X"]) & board.geometry.cellBits[cell]): raise ValueError("Cell " + str(cell) + " is taken")
+
+def chooseMoveInWorker(name, rows, cols, k, cells):
+    # Picks a move in a worker process, rebuilding the game from the cells played so far
+    strategy = strategyFor(name, geometryFor(rows, cols, k))
+    game = ttt.Game(strategy, strategy, learn=False)
+    replayCells(game, cells)
+    return strategy.choose_move(game)
+
+#############################################
+# Server
+#############################################
+
+class GameServer:
+    # Holds the games being played, keyed by game id, and answers the requests for them
+    def __init__(self, workers=None, executorStrategies=None, modelFile=None, maxGames=cfg_MaxGames):
+        warmTables(modelFile)
+        self.games = {}
+        self.busy = set()
+        self.nextGameId = 1
+        self.maxGames = maxGames
+        self.executorStrategies = set(cfg_ExecutorStrategies if (executorStrategies is None) else executorStrategies)
+        self.executor = None if (workers == 0) else ProcessPoolExecutor(max_workers=workers, initializer=warmTables, initargs=(modelFile,))
+
+    def close(self):
+        if (self.executor is not None): self.executor.shutdown(cancel_futures=True)
+
+    async def respond(self, line):
+        # Returns the response to one line from a client.  A TypeError means a field held the wrong kind of value (such
+        # as a list for the game id)
+        request = None
+        try:
+            request = json.loads(line)
+            if (type(request) is not dict): raise ValueError("A request must be a JSON object")
+            response = await self.handle(request)
+        except (ValueError, TypeError) as error:
+            response = {"error": str(error)}
+
+        if (type(request) is dict and "id" in request): response["id"] = request["id"]
+        return (json.dumps(response) + "\n").encode()
+
+    async def handle(self, request):
+        op = request.get("op")
+        if (op == "new"): return await self.newGame(request)
+        elif (op == "play"): return await self.play(request)
+        elif (op == "move"): return await self.move(request)
+        elif (op == "end"):
+            self.games.pop(request.get("game"), None)
+            return {}
+        raise ValueError("Unknown op: " + str(op))
+
+    async def chooseMove(self, game):
+        # Picks the server's move for a game, in a worker process if the strategy is an expensive one
+        strategy = game.strategies[0]
+        if (self.executor is not None and strategy.name in self.executorStrategies):
+            geometry = game.board.geometry
+            return await asyncio.get_running_loop().run_in_executor(self.executor, chooseMoveInWorker, strategy.name,
+                                                                    geometry.rows, geometry.cols, geometry.k, list(game.cells))
+        return game.chooseMoves[len(game.cells) % 2](game)
+
+    async def serverMove(self, gameId, game):
+        # Plays the server's move in a game, returning the response for the client.  The game is forgotten once it's over
+        self.busy.add(gameId)
+        try:
+            cell = await self.chooseMove(game)
+        finally:
+            self.busy.discard(gameId)
+
+        game.playMove(cell)
+        return self.result(gameId, game, cell)
+
+    def result(self, gameId, game, cell):
+        over = game.winner != "No Winner" or len(game.cells) == game.board.geometry.cells
+        if (over == True): self.games.pop(gameId, None)
+        return {"cell": cell, "winner": game.winner, "over": over}
+
+    def newGameState(self, request):
+        # The game for a "new" or "move" request, with the strategy playing both sides
+        geometry = geometryFor(request.get("rows", 3), request.get("cols", 3), request.get("k", 3))
+        strategy = strategyFor(request.get("strategy"), geometry)
+        return ttt.Game(strategy, strategy, learn=False)
+
+    async def newGame(self, request):
+        if (len(self.games) >= self.maxGames): raise ValueError("Too many games are being played")
+        player = request.get("player", ttt.cfg_Player2)
+        if (player not in [ttt.cfg_Player1, ttt.cfg_Player2]): raise ValueError("Unknown player: " + str(player))
+
+        game = self.newGameState(request)
+        gameId = self.nextGameId
+        self.nextGameId = self.nextGameId + 1
+        self.games[gameId] = (game, player)
+        if (player != ttt.cfg_Player1): return {"game": gameId}
+
+        response = await self.serverMove(gameId, game)
+        response["game"] = gameId
+        return response
+
+    async def play(self, request):
+        gameId = request.get("game")
+        if (gameId not in self.games): raise ValueError("Unknown game: " + str(gameId))
+        if (gameId in self.busy): raise ValueError("The server is still picking a move in game " + str(gameId))
+        game, player = self.games[gameId]
+        if (game.me == player): raise ValueError("It is the server's move in game " + str(gameId))
+
+        cell = request.get("cell")
+        checkMove(game, cell)
+        game.playMove(cell)
+        if (game.winner != "No Winner" or len(game.cells) == game.board.geometry.cells): return self.result(gameId, game, None)
+        return await self.serverMove(gameId, game)
+
+    async def move(self, request):
+        game = self.newGameState(request)
+        replayCells(game, request.get("cells", []))
+        if (game.winner != "No Winner" or len(game.cells) == game.board.geometry.cells): raise ValueError("The game is over")
+        return {"cell": await self.chooseMove(game)}
+
+async def serveClient(server, reader, writer):
+    # Answers each line from a client in turn until the client disconnects
+    try:
+        while True:
+            line = await reader.readline()
+            if (len(line) == 0): break
+            writer.write(await server.respond(line))
+            await writer.drain()
+    except (ConnectionError, ValueError):
+        # ValueError is raised for a line longer than the stream's limit
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, server):
+    # Serves clients until the process is interrupted or terminated, so that the worker processes are always shut down
+    listener = await asyncio.start_server(lambda reader, writer: serveClient(server, reader, writer), host, port)
+    stop = asyncio.Event()
+    for signum in [signal.SIGINT, signal.SIGTERM]: asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    print("Serving on %s:%d" % listener.sockets[0].getsockname()[:2], flush=True)
+    async with listener:
+        await stop.wait()
+
+#############################################
+# Load Generator
+#############################################
+# Each client opens its own connection and plays whole games against the server as fast as it can, picking random empty
+# cells, until the clients between them have sent the number of requests asked for.  The time of every request is kept
+# so that the percentiles can be worked out at the end.
+#############################################
+
+async def loadClient(host, port, strategies, size, rng, remaining, latencies, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    cells = size[0] * size[1]
+
+    async def request(message):
+        start = perf_counter()
+        writer.write((json.dumps(message) + "\n").encode())
+        response = json.loads(await reader.readline())
+        latencies.append(perf_counter() - start)
+        remaining[0] = remaining[0] - 1
+        if ("error" in response): counts["errors"] = counts["errors"] + 1
+        return response
+
+    try:
+        while (remaining[0] > 0):
+            # The server plays first in every other game
+            player = rng.choice([ttt.cfg_Player1, ttt.cfg_Player2])
+            response = await request({"op": "new", "strategy": rng.choice(strategies), "player": player,
+                                      "rows": size[0], "cols": size[1], "k": size[2]})
+            if ("error" in response): continue
+            gameId = response["game"]
+            played = [response["cell"]] if (response.get("cell") is not None) else []
+            over = response.get("over", False)
+
+            while (over == False and remaining[0] > 0):
+                empty = [cell for cell in range(cells) if (cell not in played)]
+                cell = rng.choice(empty)
+                response = await request({"op": "play", "game": gameId, "cell": cell})
+                if ("error" in response): break
+                played.append(cell)
+                if (response["cell"] is not None): played.append(response["cell"])
+                over = response["over"]
+
+            if (over == True): counts["games"] = counts["games"] + 1
+            else: await request({"op": "end", "game": gameId})
+    finally:
+        writer.close()
+
+def percentile(values, fraction):
+    # The value below which the given fraction of the (sorted) values fall
+    return values[min(int(fraction * len(values)), len(values) - 1)] if (len(values) > 0) else 0.0
+
+async def runLoad(host, port, clients=50, requests=20000, strategies=["Perfect"], size=(3, 3, 3), seed=1):
+    # Runs the clients against a server, returning the requests per second and the latency percentiles
+    latencies = []
+    counts = {"games": 0, "errors": 0}
+    remaining = [requests]
+    start = perf_counter()
+    await asyncio.gather(*[loadClient(host, port, strategies, size, Random(str(seed) + "/" + str(client)), remaining, latencies, counts)
+                           for client in range(clients)])
+    elapsed = perf_counter() - start
+
+    latencies.sort()
+    return {"clients": clients,
+            "requests": len(latencies),
+            "games": counts["games"],
+            "errors": counts["errors"],
+            "seconds": elapsed,
+            "requests_per_sec": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": percentile(latencies, 1.0) * 1000}
+
+async def spawnServer(arguments):
+    # Starts a server in its own process on a free port, returning the process and the port once it is listening
+    process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "serve", "--port", "0", *arguments,
+                                                   stdout=asyncio.subprocess.PIPE)
+    line = (await process.stdout.readline()).decode()
+    if (not line.startswith("Serving on ")):
+        process.kill()
+        raise RuntimeError("The server didn't start")
+    return process, int(line.rsplit(":", 1)[1])
+
+async def load(args):
+    port = args.port
+    process = None
+    if (args.spawn == True):
+        process, port = await spawnServer(["--workers", str(args.workers)])
+    try:
+        results = await runLoad(args.host, port, args.clients, args.requests, args.strategies, (args.rows, args.cols, args.k), args.seed)
+    finally:
+        if (process is not None):
+            process.terminate()
+            await process.wait()
+
+    if (args.json == True):
+        print(json.dumps(results, indent=2))
+    else:
+        print("%d clients, %d requests (%d games, %d errors) in %.2fs" % (results["clients"], results["requests"], results["games"], results["errors"], results["seconds"]))
+        print("    %10.0f requests/sec" % results["requests_per_sec"])
+        print("    %10.3f ms p50" % results["p50_ms"])
+        print("    %10.3f ms p99" % results["p99_ms"])
+        print("    %10.3f ms max" % results["max_ms"])
+
+#############################################
+# Command Line
+#############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves moves from the TicTacToe.py strategies, or puts a server under load.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serveParser = commands.add_parser("serve", help="run the server")
+    serveParser.add_argument("--host", default=cfg_Host)
+    serveParser.add_argument("--port", type=int, default=cfg_Port, help="port to listen on (0 picks a free one)")
+    serveParser.add_argument("--workers", type=int, default=None, metavar="N",
+                             help="processes for the expensive strategies (default one per CPU, 0 plays them in the server)")
+    serveParser.add_argument("--model", default=None, metavar="FILE", help="load the learned tables from this model file")
+    serveParser.add_argument("--max-games", type=int, default=cfg_MaxGames, metavar="N", help="games held in memory at once")
+
+    loadParser = commands.add_parser("load", help="play games against a server and report the latency and requests/sec")
+    loadParser.add_argument("--host", default=cfg_Host)
+    loadParser.add_argument("--port", type=int, default=cfg_Port)
+    loadParser.add_argument("--spawn", action="store_true", help="start a server for the run rather than using a running one")
+    loadParser.add_argument("--workers", type=int, default=None, metavar="N", help="worker processes for a spawned server")
+    loadParser.add_argument("--clients", type=int, default=50, metavar="N", help="connections to play games over at once")
+    loadParser.add_argument("--requests", type=int, default=20000, metavar="N", help="requests to send in total")
+    loadParser.add_argument("--strategies", nargs="+", default=["Perfect"], choices=sorted(ttt.strategyClasses), metavar="NAME",
+                            help="strategies for the server to play, picked at random for each game")
+    loadParser.add_argument("--rows", type=int, default=3)
+    loadParser.add_argument("--cols", type=int, default=3)
+    loadParser.add_argument("--k", type=int, default=3)
+    loadParser.add_argument("--seed", type=int, default=1)
+    loadParser.add_argument("--json", action="store_true", help="write the results as JSON")
+
+    args = parser.parse_args(argv)
+    if (args.command == "serve"):
+        server = GameServer(args.workers, modelFile=args.model, maxGames=args.max_games)
+        try:
+            asyncio.run(serve(args.host, args.port, server))
+        finally:
+            server.close()
+    else:
+        if (args.spawn == True and args.workers is None): args.workers = os.cpu_count()
+        asyncio.run(load(args))
+
+if __name__ == "__main__":
+    main()